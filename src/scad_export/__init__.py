@@ -1,4 +1,14 @@
+from .async_export import AsyncRenderPool, export_async
+from .duplication import DuplicationStrategy
+from .events import (ExportEvent, ExportEventType, ExportSummary, JobResult,
+                     JobStatus, JsonLinesEventSink)
 from .export import export
-from .export_config import ExportConfig, NamingFormat
+from .export_config import (ConfigError, ExportConfig, NamingFormat,
+                            add_config_arguments, config_arguments)
 from .exportable import (ColorScheme, Drawing, Folder, Image, ImageSize, Model,
-                         ModelFormat)
+                         ModelFormat, Sweep)
+from .instrumentation import Span, Tracer
+from .post_process import PostProcess
+from .render_cache import RenderCache
+from .renderers import LocalRenderer, RemoteRenderer, Renderer
+from .worker import WorkerServer, start_local_worker
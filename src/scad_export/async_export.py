@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+import weakref
+from asyncio.subprocess import DEVNULL
+from concurrent.futures import Future
+
+from .diagnostics import open_log, read_log
+from .export import (_close_run, _complete_outputs, _estimate_memory,
+                     _export_batch, _ExportRun, _finish_run,
+                     _get_batch_outputs, _get_retry_delay, _is_view_batch,
+                     _prepare_batch, _print_render_args, _record_result,
+                     _render_span, _set_render_result, _start_run,
+                     _write_run_files)
+from .export_config import ExportConfig
+from .exportable import Folder
+from .memory_limiter import MemoryMonitor
+from .renderers import (_PROCESS_GROUP_OPTIONS, LocalRenderer, RenderResult,
+                        kill_process_tree)
+
+_default_pools = weakref.WeakKeyDictionary()
+
+
+class AsyncRenderPool():
+    # Share one pool between concurrent exports so together they never run more than parallelism renders.
+    def __init__(self, parallelism = os.cpu_count()):
+        self.parallelism = parallelism
+        self._semaphore = asyncio.Semaphore(parallelism)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+
+    async def __aexit__(self, exception_type, exception, traceback):
+        self._semaphore.release()
+
+def get_default_pool(parallelism = os.cpu_count()):
+    # One pool per event loop, sized by the first export that runs on it.
+    loop = asyncio.get_running_loop()
+    if loop not in _default_pools:
+        _default_pools[loop] = AsyncRenderPool(parallelism)
+    return _default_pools[loop]
+
+async def _run_process(args, output_paths, run: _ExportRun, log_path = None):
+    config = run.config
+    start_time = time.perf_counter()
+    with open_log(log_path) as log_file:
+        process = await asyncio.create_subprocess_exec(*args, *['-o' + str(output_path) for output_path in output_paths], stdout=DEVNULL, stderr=log_file, **_PROCESS_GROUP_OPTIONS)
+        spawned_time = time.perf_counter()
+        memory_monitor = MemoryMonitor(process) if run.render_history is not None else None
+        timed_out = False
+        try:
+            await asyncio.wait_for(process.wait(), config.job_timeout)
+        except TimeoutError:
+            kill_process_tree(process)
+            await process.wait()
+            timed_out = True
+        except asyncio.CancelledError:
+            # The caller gave up on the export, so don't leave OpenSCAD running.
+            kill_process_tree(process)
+            await process.wait()
+            raise
+        finally:
+            peak_memory = memory_monitor.stop() if memory_monitor else None
+        timings = {'spawn': spawned_time - start_time, 'openscad': time.perf_counter() - spawned_time}
+        err, diagnostics = await asyncio.to_thread(read_log, log_file, 'Timed out after {} seconds'.format(config.job_timeout) if timed_out else None)
+    return RenderResult(process.returncode, err, peak_memory, timings, timed_out, diagnostics)
+
+async def _in_thread(function, *args):
+    # Cancelling a task doesn't stop its thread, so hold on to the render slot until the thread returns.
+    # Cancelling the export cancels its renders first, so that doesn't take long.
+    future = asyncio.ensure_future(asyncio.to_thread(function, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+async def _render_with_retries_async(args, output_paths, run: _ExportRun, log_path = None):
+    config = run.config
+    for attempt in range(config.retries + 1):
+        if run.cancelled.is_set():
+            return RenderResult(-1), attempt
+        if type(config.renderer) is LocalRenderer:
+            result = await _run_process(args, output_paths, run, log_path)
+        else:
+            # Other renderers block, so they get a thread each.
+            result = await _in_thread(run.renderer.render, args, output_paths, config, run.render_history is not None, config.job_timeout, log_path)
+        retry_delay = _get_retry_delay(result, attempt, args, run)
+        if retry_delay is None:
+            break
+        await asyncio.sleep(retry_delay)
+    return result, attempt + 1
+
+async def _export_batch_async(batch, run: _ExportRun):
+    if _is_view_batch(batch):
+        return await _in_thread(_export_batch, batch, run)
+    results, pending_jobs = await _in_thread(_prepare_batch, batch, run)
+    if not pending_jobs:
+        return results
+    args, output_paths, relative_paths, log_path = _get_batch_outputs(pending_jobs, run)
+    _print_render_args(args, output_paths, relative_paths, run)
+    memory_estimate = _estimate_memory(pending_jobs, run)
+    if memory_estimate:
+        try:
+            await _in_thread(run.memory_limiter.acquire, memory_estimate)
+        except asyncio.CancelledError:
+            # The thread still acquired the memory before it returned.
+            run.memory_limiter.release(memory_estimate)
+            raise
+    with _render_span(args, output_paths, relative_paths, run, memory_estimate) as span:
+        result, attempts = await _render_with_retries_async(args, output_paths, run, log_path)
+        _set_render_result(span, result, attempts)
+    return results + await _in_thread(_complete_outputs, pending_jobs, output_paths, result, span.duration, run)
+
+async def _run_batch(batch, run: _ExportRun, pool: AsyncRenderPool):
+    async with pool:
+        return await _export_batch_async(batch, run)
+
+def _cancel_tasks(run: _ExportRun, tasks):
+    # Only this export's renders are cancelled. A renderer from the config may be shared with other callers,
+    # so its renders are left to finish, and keep their render slots until they do.
+    run.cancelled.set()
+    run.cancel_renders(include_shared=False)
+    for task in tasks:
+        task.cancel()
+
+async def export_async(exportables: Folder, config: ExportConfig = None, on_event = None, pool: AsyncRenderPool = None):
+    if config is None:
+        config = ExportConfig()
+    if not config.initialized:
+        print('Export skipped because config was not initialized.')
+        return None
+
+    if pool is None:
+        pool = get_default_pool(config.parallelism)
+    start_time = time.perf_counter()
+    run, jobs, archive_paths, saved_render_count, batches = await asyncio.to_thread(_start_run, exportables, config, on_event)
+    tasks = set(asyncio.create_task(_run_batch(batch, run, pool)) for batch in batches)
+    results = []
+    deadline = start_time + config.timeout if config.timeout else None
+    try:
+        while tasks:
+            wait_timeout = max(0, deadline - time.perf_counter()) if deadline and not run.cancelled.is_set() else None
+            done, tasks = await asyncio.wait(tasks, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print('Export timed out after {} seconds, cancelling remaining jobs'.format(config.timeout))
+                _cancel_tasks(run, tasks)
+            for task in done:
+                if task.cancelled():
+                    continue
+                for result in task.result():
+                    # Post-processing runs in its thread pool, so wait for it without blocking the event loop.
+                    if isinstance(result, Future):
+                        tasks.add(asyncio.wrap_future(result))
+                    elif _record_result(result, run, results):
+                        _cancel_tasks(run, tasks)
+        for message in await asyncio.to_thread(_write_run_files, run, archive_paths):
+            print(message)
+    except asyncio.CancelledError:
+        # Cancelling the export cancels its renders, which kill their OpenSCAD processes before returning.
+        _cancel_tasks(run, tasks)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        await asyncio.to_thread(_close_run, run, jobs, results)
+    return await asyncio.to_thread(_finish_run, run, jobs, results, saved_render_count, start_time)
@@ -0,0 +1,197 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from .config_cache import FileIndex
+from .export import _plan_jobs, _walk_tree, export
+from .export_config import ExportConfig
+from .exportable import Folder, Model, Sweep
+
+_STUB_SOURCE = '''import sys
+args = sys.argv[1:]
+if '-h' in args:
+    sys.stderr.write('--backend=manifold')
+elif '--version' in args:
+    sys.stderr.write('OpenSCAD version benchmark-stub')
+else:
+    for arg in args:
+        if arg.startswith('-o'):
+            with open(arg[2:], 'w') as file:
+                file.write('solid benchmark\\nendsolid benchmark\\n')
+'''
+
+
+def _write_stub(directory: Path):
+    stub_path = directory / 'openscad_stub.py'
+    stub_path.write_text(_STUB_SOURCE)
+    if platform.system() == 'Windows':
+        launcher_path = directory / 'openscad.bat'
+        launcher_path.write_text('@"{}" "{}" %*\n'.format(sys.executable, stub_path))
+    else:
+        launcher_path = directory / 'openscad'
+        launcher_path.write_text('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, stub_path))
+        launcher_path.chmod(0o755)
+    return launcher_path
+
+def _write_project(directory: Path, file_count):
+    project_root = directory / 'project'
+    for index in range(file_count):
+        library_directory = project_root / 'lib' / 'group_{}'.format(index % 20)
+        library_directory.mkdir(parents=True, exist_ok=True)
+        (library_directory / 'part_{}.scad'.format(index)).write_text('module part_{}() cube(1);\n'.format(index))
+    export_file_path = project_root / 'benchmark export map.scad'
+    export_file_path.write_text('name = "";\ncube(1);\n')
+    return project_root, export_file_path
+
+def _benchmark_config(workspace: Path, **kwargs):
+    return ExportConfig(entry_point=workspace / 'benchmark.py', **kwargs)
+
+def _write_config(workspace: Path, openscad_location, project_root, export_file_path, output_directory):
+    config = {
+        'openScadLocation': str(openscad_location),
+        'projectRoot': str(project_root),
+        'benchmark.exportMapFile': str(export_file_path),
+        'benchmark.outputDirectory': str(output_directory)
+    }
+    with open(workspace / 'export config.json', 'w') as file:
+        json.dump(config, file, indent=2)
+
+def _build_tree(part_count, folder_size):
+    folders = []
+    for folder_index in range(0, part_count, folder_size):
+        parts = [Model(name='part', index=index) for index in range(folder_index, min(folder_index + folder_size, part_count))]
+        folders.append(Folder('folder_{}'.format(folder_index // folder_size), parts))
+    return Folder('benchmark', folders)
+
+def _build_deep_tree(depth):
+    tree = Model(name='part', index=depth)
+    for index in range(depth):
+        tree = Folder('level', [Model(name='part', index=index), tree])
+    return tree
+
+def _measure_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _time(function, repeat = 1):
+    # The fastest run is the one least disturbed by everything else on the machine. Garbage collection is
+    # paused like timeit does, since when it happens to run depends on everything allocated before.
+    durations = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start_time)
+            gc.collect()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(durations)
+
+def _get_parallelism_levels(max_parallelism):
+    levels = []
+    level = 1
+    while level < max_parallelism:
+        levels.append(level)
+        level *= 2
+    levels.append(max_parallelism)
+    return levels
+
+def run_benchmarks(tree_size = 10000, spawn_jobs = 32, copy_quantity = 50, project_files = 2000, max_parallelism = os.cpu_count(), repeat = 5):
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_directory, redirect_stdout(io.StringIO()):
+        workspace = Path(temp_directory)
+        openscad_location = _write_stub(workspace)
+        project_root, export_file_path = _write_project(workspace, project_files)
+        output_directory = workspace / 'output'
+        output_directory.mkdir()
+        _write_config(workspace, openscad_location, project_root, export_file_path, output_directory)
+
+        results['config_init.seconds'] = _time(lambda: _benchmark_config(workspace), repeat)
+        config = _benchmark_config(workspace)
+        # Probe and scan directly so the capability cache and file index don't hide their cost.
+        results['manifold_probe.seconds'] = _time(config._probe_manifold_supported, repeat)
+        results['export_file_scan.seconds'] = _time(FileIndex(project_root)._build, repeat)
+
+        tree = _build_tree(tree_size, 100)
+        results['flatten.seconds'] = _time(lambda: deque(_walk_tree(tree, config.output_naming_format), maxlen=0), repeat)
+        results['plan.seconds'] = _time(lambda: _plan_jobs(tree, config), repeat)
+        results['plan.parts'] = tree_size
+        results['plan.bytes_per_part'] = _measure_memory(lambda: _plan_jobs(_build_tree(tree_size, 100), config)) / tree_size
+
+        # Per-part planning time should stay flat as the tree grows, for both wide and deeply nested trees.
+        scaling_sizes = [tree_size // 8, tree_size // 4, tree_size // 2, tree_size]
+        for size in scaling_sizes:
+            wide_tree = _build_tree(size, 100)
+            results['plan_scaling.parts_{}.seconds'.format(size)] = _time(lambda: _plan_jobs(wide_tree, config), repeat)
+        results['plan_scaling.ratio'] = (results['plan_scaling.parts_{}.seconds'.format(tree_size)] / tree_size) / (results['plan_scaling.parts_{}.seconds'.format(scaling_sizes[0])] / scaling_sizes[0])
+        deep_tree = _build_deep_tree(2000)
+        results['plan_deep.seconds'] = _time(lambda: _plan_jobs(deep_tree, config), repeat)
+        sweep = Folder('sweep', Sweep(Model(name='part'), x=range(tree_size // 100), y=range(100)))
+        results['plan_sweep.seconds'] = _time(lambda: _plan_jobs(sweep, config), repeat)
+        results['plan_sweep.bytes_per_part'] = _measure_memory(lambda: _plan_jobs(sweep, config)) / tree_size
+
+        for parallelism in _get_parallelism_levels(max_parallelism):
+            config = _benchmark_config(workspace, parallelism=parallelism)
+            seconds = _time(lambda: export(_build_tree(spawn_jobs, 10), config), repeat)
+            results['spawn.parallelism_{}.seconds'.format(parallelism)] = seconds
+            results['spawn.parallelism_{}.jobs_per_second'.format(parallelism)] = spawn_jobs / seconds
+
+        config = _benchmark_config(workspace, parallelism=1)
+        results['copy_fan_out.seconds'] = _time(lambda: export(Folder('copies', Model(name='part', quantity=copy_quantity)), config), repeat)
+        results['copy_fan_out.copies'] = copy_quantity
+    return results
+
+def compare_to_baseline(results, baseline, tolerance = 0.2, noise_floor = 0.01):
+    # Phases that only take a few milliseconds vary by more than the tolerance from run to run, so a
+    # slowdown also has to be larger than the noise floor, in seconds.
+    regressions = []
+    for key, value in results.items():
+        baseline_value = baseline.get(key)
+        if key.endswith('.seconds') and baseline_value and value > baseline_value * (1 + tolerance) and value - baseline_value > noise_floor:
+            regressions.append('{}: {:.4f}s vs baseline {:.4f}s ({:+.0%})'.format(key, value, baseline_value, value / baseline_value - 1))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark SCAD Export overhead using a stub OpenSCAD executable.')
+    parser.add_argument('--output', help='Write results as JSON to this path.')
+    parser.add_argument('--baseline', help='Compare results to a JSON file written by a previous run.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown relative to the baseline.')
+    parser.add_argument('--noise-floor', type=float, default=0.01, help='Slowdowns of fewer seconds than this are never regressions.')
+    parser.add_argument('--repeat', type=int, default=5, help='Time each phase this many times and keep the fastest.')
+    parser.add_argument('--tree-size', type=int, default=10000)
+    parser.add_argument('--spawn-jobs', type=int, default=32)
+    parser.add_argument('--copy-quantity', type=int, default=50)
+    parser.add_argument('--project-files', type=int, default=2000)
+    parser.add_argument('--max-parallelism', type=int, default=os.cpu_count())
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.tree_size, arguments.spawn_jobs, arguments.copy_quantity, arguments.project_files, arguments.max_parallelism, arguments.repeat)
+    for key, value in results.items():
+        print('{:<40} {}'.format(key, round(value, 4)))
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as file:
+            regressions = compare_to_baseline(results, json.load(file), arguments.tolerance, arguments.noise_floor)
+        if regressions:
+            print('\nRegressions:\n' + '\n'.join(regressions))
+            sys.exit(1)
+        print('\nNo regressions against baseline.')
@@ -0,0 +1,188 @@
+import argparse
+import inspect
+import platform
+import runpy
+import shlex
+import subprocess
+import sys
+from contextlib import ExitStack, contextmanager
+from fnmatch import fnmatch
+from pathlib import Path
+
+from .export import (_batch_jobs, _format_path_name, _get_batch_args,
+                     _get_geometry_args, _get_view_args, _is_view_batch,
+                     _plan_jobs, export)
+from .export_config import (ConfigError, ExportConfig, add_config_arguments,
+                            config_arguments)
+from .exportable import Exportable, Folder, Sweep
+from .post_process import PostProcess
+
+
+class _DeferredConfig():
+    # Stands in for ExportConfig while a definition loads, so nothing is resolved, prompted for or saved
+    # until the command line options have been applied on top.
+    def __init__(self, *args, **kwargs):
+        self.options = inspect.signature(ExportConfig).bind(*args, **kwargs).arguments
+
+@contextmanager
+def _replaced(name, replacement, module_names):
+    modules = [sys.modules[module_name] for module_name in module_names]
+    originals = [getattr(module, name) for module in modules]
+    for module in modules:
+        setattr(module, name, replacement)
+    try:
+        yield
+    finally:
+        for module, original in zip(modules, originals):
+            setattr(module, name, original)
+
+def _load_definition(definition_path, variable_name, config_variable_name):
+    exported_configs = []
+
+    # Unguarded definitions call export() while loading, so it only notes the config until they're loaded.
+    def skip_export(exportables, config = None, *args, **kwargs):
+        exported_configs.append(config)
+
+    async def skip_export_async(exportables, config = None, *args, **kwargs):
+        exported_configs.append(config)
+
+    with ExitStack() as stack:
+        stack.enter_context(_replaced('export', skip_export, ['scad_export', 'scad_export.export']))
+        stack.enter_context(_replaced('export_async', skip_export_async, ['scad_export', 'scad_export.async_export']))
+        stack.enter_context(_replaced('ExportConfig', _DeferredConfig, ['scad_export', 'scad_export.export_config']))
+        # Run under a name other than __main__ so a definition guarded by "if __name__ == '__main__'" doesn't export itself.
+        namespace = runpy.run_path(definition_path, run_name='scad_export_definition')
+    if variable_name not in namespace:
+        raise SystemExit('"{}" does not define "{}".'.format(definition_path, variable_name))
+    config = namespace.get(config_variable_name)
+    if not isinstance(config, _DeferredConfig):
+        config = next((exported_config for exported_config in exported_configs if isinstance(exported_config, _DeferredConfig)), None)
+    return namespace[variable_name], dict(config.options) if config else {}
+
+def _parse_arg_filters(arg_filters):
+    parsed_filters = {}
+    for arg_filter in arg_filters:
+        key, separator, value = arg_filter.partition('=')
+        if not separator:
+            raise SystemExit('Invalid --arg filter "{}", expected KEY=VALUE.'.format(arg_filter))
+        parsed_filters.setdefault(key, []).append(value)
+    return parsed_filters
+
+def _matches(folder_paths, exportable: Exportable, arguments):
+    # Folders match by their names in the definition or by the formatted paths that --dry-run prints.
+    if arguments.folder and not any(fnmatch(folder_path.strip('/'), pattern.strip('/')) for folder_path in folder_paths for pattern in arguments.folder):
+        return False
+    if arguments.name and not any(fnmatch(exportable.name, pattern) or fnmatch(exportable.file_name, pattern) for pattern in arguments.name):
+        return False
+    for key, patterns in _parse_arg_filters(arguments.arg).items():
+        if key not in exportable.user_args or not any(fnmatch(str(exportable.user_args[key]), pattern) for pattern in patterns):
+            return False
+    return True
+
+def _filter_tree(item, arguments, naming_format, folder_paths = ('', '')):
+    if isinstance(item, Exportable):
+        return item if _matches(folder_paths, item, arguments) else None
+    if isinstance(item, Sweep):
+        # Filter variants as they're generated rather than expanding the sweep here.
+        include = lambda args: item.is_included(args) and _matches(folder_paths, item.variant(args), arguments)
+        sweep = Sweep(item.template, include, **item.sweep_args)
+        return sweep if next(sweep.variants(), None) is not None else None
+    folder_path, formatted_folder_path = folder_paths
+    folder_paths = (folder_path + '/' + item.name, formatted_folder_path + _format_path_name('/' + item.name, naming_format))
+    contents = [_filter_tree(subitem, arguments, naming_format, folder_paths) for subitem in item.contents]
+    contents = [subitem for subitem in contents if subitem is not None]
+    return Folder(item.name, contents, item.archive) if contents else None
+
+def _join_args(args):
+    # Quoted so paths with spaces can be copied into a shell.
+    if platform.system() == 'Windows':
+        return subprocess.list2cmdline(args)
+    return shlex.join(args)
+
+def _print_plan(exportables: Folder, config: ExportConfig):
+    jobs = _plan_jobs(exportables, config)
+    batches = _batch_jobs(jobs, config)
+    for batch in batches:
+        for job in batch:
+            for output_path in job.output_paths:
+                print(output_path)
+        if _is_view_batch(batch):
+            print('  ' + _join_args(_get_geometry_args(batch[0]) + ['-ogeometry.stl']))
+            for job in batch:
+                print('  ' + _join_args(_get_view_args(job, config, 'views.scad') + ['-o' + config.output_directory + next(iter(job.output_paths))]))
+        else:
+            print('  ' + _join_args(_get_batch_args(batch) + ['-o' + config.output_directory + next(iter(job.output_paths)) for job in batch]))
+    print('\n{} renders planned for {} output files.'.format(len(batches), sum(len(job.output_paths) for job in jobs)))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='scad-export', description='Export parts defined in a Python exportables definition.')
+    parser.add_argument('definition', help='Python file that defines the exportables Folder.')
+    parser.add_argument('--variable', default='exportables', help='Name of the Folder variable in the definition file.')
+    parser.add_argument('--config-variable', default='config', help='Name of the ExportConfig variable in the definition file, if it has one. Other options override its values.')
+    parser.add_argument('--folder', action='append', default=[], help='Only export parts in folders matching this glob, e.g. "example/cubes*".')
+    parser.add_argument('--name', action='append', default=[], help='Only export parts whose name or file name matches this glob.')
+    parser.add_argument('--arg', action='append', default=[], help='Only export parts with a user arg matching KEY=VALUE, where VALUE may be a glob.')
+    parser.add_argument('--dry-run', action='store_true', help='Print the planned outputs and OpenSCAD arguments without exporting.')
+    parser.add_argument('--parallelism', type=int, help='Number of OpenSCAD processes to run at once.')
+    parser.add_argument('--incremental', action='store_true', default=None, help='Only export parts whose outputs are older than their sources.')
+    parser.add_argument('--render-cache', action='store_true', default=None, help='Reuse cached renders of unchanged parts.')
+    parser.add_argument('--clear-render-cache', action='store_true', default=None, help='Delete all cached renders before exporting.')
+    parser.add_argument('--batch-outputs', action='store_true', default=None, help='Render outputs that share geometry in one OpenSCAD process.')
+    parser.add_argument('--share-image-geometry', action='store_true', default=None, help='Render images of the same part from one mesh instead of re-rendering it for each view.')
+    parser.add_argument('--manifest', action='store_true', default=None, help='Write a manifest.json of output hashes to each output folder and leave unchanged files untouched.')
+    parser.add_argument('--log-directory', help='Write the OpenSCAD output of each part to a .log file under this directory.')
+    parser.add_argument('--preprocess', action='store_true', default=None, help='Inline the export map\'s includes into one cached file that every render reads instead.')
+    parser.add_argument('--job-timeout', type=float, help='Kill a render that runs longer than this many seconds.')
+    parser.add_argument('--timeout', type=float, help='Cancel the export if it runs longer than this many seconds.')
+    parser.add_argument('--retries', type=int, help='Retry renders that crash or lose their worker this many times.')
+    parser.add_argument('--fail-fast', action='store_true', default=None, help='Cancel the remaining renders after the first failure.')
+    parser.add_argument('--post-process', action='append', choices=[step.value for step in PostProcess], help='Post-process outputs after they are rendered. May be given more than once.')
+    parser.add_argument('--debug', action='store_true', default=None)
+    add_config_arguments(parser)
+    arguments = parser.parse_args(argv)
+
+    definition_path = Path(arguments.definition).resolve()
+    exportables, config_options = _load_definition(definition_path, arguments.variable, arguments.config_variable)
+    # The config file and data directory are found next to the definition, as when it's run as a script.
+    config_options.setdefault('entry_point', definition_path)
+    overrides = dict(
+        config_arguments(arguments),
+        parallelism=arguments.parallelism,
+        incremental=arguments.incremental,
+        use_render_cache=arguments.render_cache,
+        clear_render_cache=arguments.clear_render_cache,
+        batch_outputs=arguments.batch_outputs,
+        share_image_geometry=arguments.share_image_geometry,
+        write_manifest=arguments.manifest,
+        log_directory=arguments.log_directory,
+        preprocess_export_file=arguments.preprocess,
+        post_processing=[PostProcess(step) for step in arguments.post_process] if arguments.post_process else None,
+        job_timeout=arguments.job_timeout,
+        timeout=arguments.timeout,
+        retries=arguments.retries,
+        fail_fast=arguments.fail_fast,
+        debug=arguments.debug
+    )
+    # Only options given on the command line replace the definition's.
+    config_options.update((name, value) for name, value in overrides.items() if value is not None)
+    try:
+        config = ExportConfig(**config_options)
+    except ConfigError:
+        # ExportConfig has already printed why.
+        return 1
+    if not config.initialized:
+        return 1
+
+    exportables = _filter_tree(exportables, arguments, config.output_naming_format)
+    if exportables is None:
+        print('No parts match the given filters.')
+        return 1
+
+    if arguments.dry_run:
+        _print_plan(exportables, config)
+        return 0
+    summary = export(exportables, config)
+    return 0 if summary and summary.succeeded else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
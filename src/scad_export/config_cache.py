@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+SKIPPED_DIRECTORIES = {'node_modules', '__pycache__'}
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except Exception:
+        return {}
+
+def _save_json(path, value):
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(value, file, indent=2)
+    except OSError:
+        # The caches only save time, so a read-only location just means probing again next run.
+        pass
+
+def _is_skipped_directory(parent, name):
+    # Folders like build or output are left in, since projects may keep export maps there. Virtual environments
+    # are recognized by their pyvenv.cfg whatever they're called.
+    return name.startswith('.') or name in SKIPPED_DIRECTORIES or os.path.isfile(os.path.join(parent, name, 'pyvenv.cfg'))
+
+class FileIndex():
+    def __init__(self, root, cache_path = None, extension = '.scad'):
+        self.root = str(Path(root).resolve())
+        self.cache_path = cache_path
+        self.extension = extension
+        self._files = None
+
+    def _is_cache_valid(self, cached):
+        if cached.get('root') != self.root or cached.get('extension') != self.extension:
+            return False
+        # An index built while skipping other folders may be missing files.
+        if cached.get('skipped') != sorted(SKIPPED_DIRECTORIES):
+            return False
+        # Adding, removing or renaming an entry updates its directory's modification time.
+        for directory, modification_time in cached.get('directories', {}).items():
+            try:
+                if os.stat(directory).st_mtime != modification_time:
+                    return False
+            except OSError:
+                return False
+        return 'directories' in cached
+
+    def _build(self):
+        directories = {}
+        files = []
+        for root, directory_names, file_names in os.walk(self.root):
+            directory_names[:] = sorted(name for name in directory_names if not _is_skipped_directory(root, name))
+            directories[root] = os.stat(root).st_mtime
+            files.extend(os.path.join(root, file_name) for file_name in sorted(file_names) if file_name.lower().endswith(self.extension))
+        if self.cache_path:
+            _save_json(self.cache_path, {'root': self.root, 'extension': self.extension, 'skipped': sorted(SKIPPED_DIRECTORIES), 'directories': directories, 'files': files})
+        return files
+
+    @property
+    def files(self):
+        if self._files is None:
+            cached = _load_json(self.cache_path) if self.cache_path else {}
+            self._files = cached['files'] if self._is_cache_valid(cached) else self._build()
+        return self._files
+
+    def find(self, file_name):
+        for file_path in self.files:
+            if os.path.basename(file_path) == file_name:
+                return file_path
+        return ''
+
+    def invalidate(self):
+        self._files = None
+        if self.cache_path:
+            Path(self.cache_path).unlink(missing_ok=True)
+
+class CapabilityCache():
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._entries = _load_json(cache_path)
+
+    def get(self, executable, name, probe):
+        executable_path = shutil.which(executable) or executable
+        try:
+            modification_time = os.path.getmtime(executable_path)
+        except OSError:
+            return probe()
+        # Replacing or upgrading the executable changes its modification time, which drops the stale entry.
+        entry = self._entries.get(executable_path)
+        if entry is None or entry.get('mtime') != modification_time:
+            entry = {'mtime': modification_time}
+            self._entries[executable_path] = entry
+        if name not in entry:
+            entry[name] = probe()
+            _save_json(self.cache_path, self._entries)
+        return entry[name]
@@ -0,0 +1,92 @@
+import os
+import platform
+import re
+import shutil
+from pathlib import Path
+
+_COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_DEPENDENCY_PATTERN = re.compile(r'^\s*(?:include|use)\s*<([^>]+)>', re.MULTILINE)
+
+
+def _get_user_library_directory():
+    if platform.system() in ('Windows', 'Darwin'):
+        return Path.home() / 'Documents' / 'OpenSCAD' / 'libraries'
+    return Path(os.environ.get('XDG_DATA_HOME') or Path.home() / '.local' / 'share') / 'OpenSCAD' / 'libraries'
+
+def _get_installation_library_directory(openscad_location):
+    openscad_path = shutil.which(openscad_location) or openscad_location
+    openscad_path = Path(openscad_path).resolve()
+    if openscad_path.suffix == '.app':
+        return openscad_path / 'Contents' / 'Resources' / 'libraries'
+    if platform.system() == 'Darwin':
+        return openscad_path.parent.parent / 'Resources' / 'libraries'
+    if platform.system() == 'Windows':
+        return openscad_path.parent / 'libraries'
+    return openscad_path.parent.parent / 'share' / 'openscad' / 'libraries'
+
+def _get_library_directories(openscad_location = None):
+    # The same order OpenSCAD searches in: OPENSCADPATH, then the user's library folder, then the one it was installed with.
+    directories = []
+    for library_path in os.environ.get('OPENSCADPATH', '').split(os.pathsep):
+        if library_path:
+            directories.append(Path(library_path))
+    directories.append(_get_user_library_directory())
+    if openscad_location:
+        directories.append(_get_installation_library_directory(openscad_location))
+    return directories
+
+def _resolve_dependency(dependency_name, including_file: Path, library_directories):
+    # OpenSCAD looks next to the including file first, then in the library paths.
+    for directory in [including_file.parent] + library_directories:
+        candidate = directory / dependency_name
+        if candidate.is_file():
+            return candidate.resolve()
+    return None
+
+def _get_direct_dependencies(file_path: Path, library_directories):
+    try:
+        with open(file_path, 'r', encoding='UTF-8', errors='replace') as file:
+            source = _COMMENT_PATTERN.sub('', file.read())
+    except OSError:
+        return []
+    dependencies = []
+    for dependency_name in _DEPENDENCY_PATTERN.findall(source):
+        dependency = _resolve_dependency(dependency_name.strip(), file_path, library_directories)
+        if dependency:
+            dependencies.append(dependency)
+    return dependencies
+
+def get_dependency_graph(file_path, openscad_location = None):
+    library_directories = _get_library_directories(openscad_location)
+    root = Path(file_path).resolve()
+    graph = {}
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        if current in graph:
+            continue
+        graph[current] = _get_direct_dependencies(current, library_directories)
+        pending.extend(graph[current])
+    return graph
+
+def get_dependencies(file_path, openscad_location = None):
+    return sorted(get_dependency_graph(file_path, openscad_location))
+
+def get_modification_times(file_paths):
+    modification_times = {}
+    for file_path in file_paths:
+        try:
+            modification_times[file_path] = os.path.getmtime(file_path)
+        except OSError:
+            pass
+    return modification_times
+
+def get_stale_sources(output_paths, source_modification_times):
+    oldest_output_time = None
+    for output_path in output_paths:
+        try:
+            output_time = os.path.getmtime(output_path)
+        except OSError:
+            return None
+        oldest_output_time = output_time if oldest_output_time is None else min(oldest_output_time, output_time)
+    return [source for source, source_time in source_modification_times.items() if source_time > oldest_output_time]
@@ -0,0 +1,137 @@
+import re
+import tempfile
+from collections import deque
+from pathlib import Path
+
+from .events import JobStatus
+
+ERROR_TAIL_LINES = 50
+
+_MESSAGE_PATTERN = re.compile(r'^(WARNING|DEPRECATED|ERROR|CGAL error|Timed out)')
+_CATEGORY_PATTERNS = [
+    ('timeout', re.compile(r'^Timed out after')),
+    ('syntax error', re.compile(r'Parser error|syntax error')),
+    ('missing file', re.compile(r"Can't open (include|library|input) file|Could not (read|open) file|File not found")),
+    ('unknown module', re.compile(r'Ignoring unknown module|unknown module')),
+    ('unknown function', re.compile(r'Ignoring unknown function|unknown function')),
+    ('unknown variable', re.compile(r'Ignoring unknown variable|unknown variable')),
+    ('assertion failed', re.compile(r'Assertion .* failed')),
+    ('recursion', re.compile(r'Recursion detected|stack overflow', re.IGNORECASE)),
+    ('non-manifold', re.compile(r'2-manifold|non-manifold|self-intersect', re.IGNORECASE)),
+    ('CGAL', re.compile(r'CGAL')),
+    ('empty geometry', re.compile(r'top level object is empty|No top.level geometry', re.IGNORECASE)),
+    ('export failed', re.compile(r"Can't write export file|Could not export|export failed", re.IGNORECASE)),
+    ('deprecated', re.compile(r'^DEPRECATED'))
+]
+
+
+def _categorize(line):
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(line):
+            return category
+    return None
+
+class DiagnosticScanner():
+    # Takes OpenSCAD's output a line at a time, so only the per-category counts and the last lines are kept in memory.
+    def __init__(self, tail_lines = ERROR_TAIL_LINES):
+        self.diagnostics = {}
+        self._tail = deque(maxlen=tail_lines)
+
+    def feed(self, line):
+        line = line.rstrip()
+        if not line:
+            return
+        self._tail.append(line)
+        message = _MESSAGE_PATTERN.match(line)
+        if not message:
+            return
+        severity = 'warning' if message.group(1) in ('WARNING', 'DEPRECATED') else 'error'
+        category = _categorize(line) or 'other ' + severity
+        entry = self.diagnostics.setdefault(category, {'severity': severity, 'count': 0, 'message': line})
+        entry['count'] += 1
+        if severity == 'error' and entry['severity'] == 'warning':
+            entry['severity'] = 'error'
+            entry['message'] = line
+
+    def scan(self, file):
+        for line in file:
+            self.feed(line.decode('UTF-8', errors='replace') if isinstance(line, bytes) else line)
+
+    @property
+    def tail(self):
+        return '\n'.join(self._tail).encode('UTF-8')
+
+def open_log(log_path = None):
+    # Without a log directory the output still goes to a file rather than memory, it's just discarded afterwards.
+    if log_path is None:
+        return tempfile.TemporaryFile()
+    Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+    return open(log_path, 'w+b')
+
+def read_log(log_file, timeout_message = None):
+    if timeout_message:
+        log_file.write(('\n' + timeout_message + '\n').encode('UTF-8'))
+    log_file.seek(0)
+    scanner = DiagnosticScanner()
+    scanner.scan(log_file)
+    return scanner.tail, scanner.diagnostics
+
+def parse_diagnostics(stderr):
+    scanner = DiagnosticScanner()
+    scanner.scan(stderr.splitlines())
+    return scanner.diagnostics
+
+def get_diagnostics(result):
+    # Renderers that only return OpenSCAD's output are parsed here instead.
+    if result.diagnostics is not None:
+        return result.diagnostics
+    return parse_diagnostics(result.err.decode('UTF-8', errors='replace'))
+
+def merge_diagnostics(*all_diagnostics):
+    merged = {}
+    for diagnostics in all_diagnostics:
+        for category, entry in diagnostics.items():
+            if category in merged:
+                merged_entry = merged[category]
+                merged_entry['count'] += entry['count']
+                if entry['severity'] == 'error' and merged_entry['severity'] == 'warning':
+                    merged_entry['severity'] = 'error'
+                    merged_entry['message'] = entry['message']
+            else:
+                merged[category] = dict(entry)
+    return merged
+
+def get_warnings(diagnostics):
+    return [category for category, entry in diagnostics.items() if entry['severity'] == 'warning']
+
+def get_failure_cause(returncode, diagnostics):
+    errors = [category for category, entry in diagnostics.items() if entry['severity'] == 'error']
+    if errors:
+        return errors[0]
+    if returncode not in (0, 1):
+        return 'crashed (exit code {})'.format(returncode)
+    return 'unknown'
+
+def _format_table(title, groups):
+    lines = [title, '  {:<24} {:>6}  {}'.format('Cause', 'Parts', 'Example')]
+    for cause, examples in sorted(groups.items(), key=lambda group: len(group[1]), reverse=True):
+        path, message = examples[0]
+        lines.append('  {:<24} {:>6}  {}{}'.format(cause, len(examples), path, ': ' + message if message else ''))
+    return lines
+
+def format_triage_report(results):
+    failures = {}
+    warnings = {}
+    for result in results:
+        if result.status is JobStatus.FAILED:
+            cause = get_failure_cause(result.returncode, result.diagnostics)
+            failures.setdefault(cause, []).append((result.output_paths[0], result.diagnostics.get(cause, {}).get('message')))
+        elif result.status is not JobStatus.CANCELLED:
+            for category in get_warnings(result.diagnostics):
+                warnings.setdefault(category, []).append((result.output_paths[0], result.diagnostics[category]['message']))
+    lines = []
+    if failures:
+        lines += _format_table('Failures by cause:', failures)
+    if warnings:
+        lines += _format_table('Warnings by cause:', warnings)
+    return '\n'.join(lines)
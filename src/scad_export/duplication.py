@@ -0,0 +1,89 @@
+import json
+import os
+import platform
+import shutil
+from enum import StrEnum, auto
+from pathlib import Path
+from threading import Lock
+from uuid import uuid4
+
+_FICLONE = 0x40049409
+
+
+class DuplicationStrategy(StrEnum):
+    COPY = auto()
+    HARDLINK = auto()
+    REFLINK = auto()
+    SYMLINK = auto()
+    MANIFEST = auto()
+
+def _reflink(source, destination):
+    if platform.system() == 'Linux':
+        import fcntl
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), _FICLONE, source_file.fileno())
+            except OSError:
+                destination_file.close()
+                os.unlink(destination)
+                raise
+    elif platform.system() == 'Darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) != 0:
+            raise OSError(ctypes.get_errno(), 'clonefile failed')
+    else:
+        raise OSError('Reflinks are not supported on {}'.format(platform.system()))
+
+def get_temp_path(path):
+    path = Path(path)
+    # Keep the extension, since OpenSCAD picks the export format from it.
+    return str(path.with_name('.{}.{}.tmp{}'.format(path.stem, uuid4().hex[:8], path.suffix)))
+
+def duplicate(source, destination, strategy: DuplicationStrategy):
+    if strategy is DuplicationStrategy.MANIFEST:
+        return strategy
+    # Every strategy writes a temporary file and renames it, so the destination is never partially written.
+    temp_path = get_temp_path(destination)
+    used_strategy = DuplicationStrategy.COPY
+    try:
+        if strategy is DuplicationStrategy.HARDLINK:
+            os.link(source, temp_path)
+        elif strategy is DuplicationStrategy.REFLINK:
+            _reflink(source, temp_path)
+        elif strategy is DuplicationStrategy.SYMLINK:
+            os.symlink(os.path.relpath(source, os.path.dirname(destination)), temp_path)
+        if strategy is not DuplicationStrategy.COPY:
+            used_strategy = strategy
+    except (OSError, AttributeError):
+        # Crossing filesystems, or a filesystem without link or clone support, falls back to a byte copy.
+        Path(temp_path).unlink(missing_ok=True)
+    try:
+        if used_strategy is DuplicationStrategy.COPY:
+            shutil.copy(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    return used_strategy
+
+class CopiesManifest():
+    def __init__(self):
+        self._copies = {}
+        self._lock = Lock()
+
+    def add(self, source, destination):
+        with self._lock:
+            self._copies.setdefault(source, []).append(destination)
+
+    def save(self, path):
+        if not self._copies:
+            return
+        try:
+            with open(path, 'r') as file:
+                copies = json.load(file)
+        except Exception:
+            copies = {}
+        copies.update(self._copies)
+        with open(path, 'w') as file:
+            json.dump(copies, file, indent=2)
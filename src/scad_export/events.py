@@ -0,0 +1,76 @@
+import json
+import time
+from enum import StrEnum, auto
+from threading import Lock
+
+
+class ExportEventType(StrEnum):
+    QUEUED = auto()
+    STARTED = auto()
+    FINISHED = auto()
+    FAILED = auto()
+    COPIED = auto()
+    SKIPPED = auto()
+
+class ExportEvent():
+    def __init__(self, type: ExportEventType, path, duration = None, returncode = None, error = None, cached = None):
+        self.type = type
+        self.path = path
+        self.time = time.time()
+        self.duration = duration
+        self.returncode = returncode
+        self.error = error
+        self.cached = cached
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items() if value is not None}
+
+class JsonLinesEventSink():
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        open(self.path, 'w').close()
+
+    def __call__(self, event: ExportEvent):
+        with self._lock, open(self.path, 'a') as file:
+            file.write(json.dumps(event.to_dict()) + '\n')
+
+class JobStatus(StrEnum):
+    FINISHED = auto()
+    CACHED = auto()
+    UP_TO_DATE = auto()
+    RESUMED = auto()
+    FAILED = auto()
+    CANCELLED = auto()
+
+class JobResult():
+    def __init__(self, output_paths, status: JobStatus, message, returncode = 0, error = '', duration = 0, timings = None, statistics = None, diagnostics = None, log_path = None):
+        self.output_paths = output_paths
+        self.status = status
+        self.message = message
+        self.returncode = returncode
+        self.error = error
+        self.duration = duration
+        self.timings = timings if timings else {}
+        self.statistics = statistics if statistics else {}
+        self.diagnostics = diagnostics if diagnostics else {}
+        self.log_path = log_path
+
+class ExportSummary():
+    def __init__(self, results, saved_render_count, duration, cancelled = False, changes = None):
+        self.results = results
+        self.saved_render_count = saved_render_count
+        self.duration = duration
+        self.cancelled = cancelled
+        self.changes = changes
+
+    def count(self, status: JobStatus):
+        return sum(1 for result in self.results if result.status is status)
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.status is JobStatus.FAILED]
+
+    @property
+    def succeeded(self):
+        return not self.failed and not self.cancelled
@@ -1,24 +1,36 @@
-import shutil
+import os
+import signal
 import string
-from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from contextlib import contextmanager
 from numbers import Number
 from pathlib import Path
-from subprocess import PIPE, Popen
+from threading import Event, current_thread, main_thread
 
+from .dependencies import (get_dependencies, get_modification_times,
+                           get_stale_sources)
+from .diagnostics import (format_triage_report, get_diagnostics, get_warnings,
+                          merge_diagnostics)
+from .duplication import (CopiesManifest, DuplicationStrategy, duplicate,
+                          get_temp_path)
+from .events import (ExportEvent, ExportEventType, ExportSummary, JobResult,
+                     JobStatus)
 from .export_config import ExportConfig, NamingFormat
-from .exportable import Exportable, Folder, Image, Model
+from .exportable import Exportable, Folder, Image, Model, Sweep
+from .instrumentation import format_slowest_report, parse_render_statistics
+from .journal import ExportJournal
+from .manifest import OutputManifest, hash_file
+from .memory_limiter import DEFAULT_RENDER_MEMORY, MemoryLimiter
+from .post_process import archive_directory, format_size, post_process_file
+from .preprocess import PreprocessError, get_flattened_export_file
+from .render_cache import RenderCache, get_sources_hash
+from .render_history import RenderHistory
+from .renderers import LocalRenderer, RemoteRenderer, Renderer, RenderResult
 
 
-def _flatten_paths(item, current_path = '', paths_and_exportables = None):
-    if paths_and_exportables is None:
-        paths_and_exportables = {}
-    if isinstance(item, Exportable):
-        paths_and_exportables.setdefault(current_path, []).append(item)
-    elif isinstance(item, Folder):
-        for subitem in item.contents:
-            paths_and_exportables.update(_flatten_paths(subitem, current_path + '/' + item.name, paths_and_exportables))
-    return paths_and_exportables
-
 def _format_name(name, naming_format: NamingFormat):
     formatted_name = name
     if naming_format is NamingFormat.TITLE_CASE:
@@ -42,10 +54,29 @@ def _format_part_name(name, naming_format: NamingFormat, file_format, user_args,
     formatted_name = _format_name(formatted_name, naming_format).format(*flattened_args)
     return formatted_name + file_format
 
-def _get_exportable_args(exportable: Exportable, config: ExportConfig):
+def _walk_tree(root, naming_format: NamingFormat):
+    # Iterative so deep trees don't hit the recursion limit. Yields each Folder before its contents, with
+    # the formatted path of the folder an item is in. Sweep variants are created one at a time as they're reached.
+    stack = [('', iter((root,)))]
+    while stack:
+        folder_path, items = stack[-1]
+        for item in items:
+            if isinstance(item, Folder):
+                yield folder_path, item
+                stack.append((folder_path + _format_path_name('/' + item.name, naming_format), iter(item.contents)))
+                break
+            elif isinstance(item, Exportable):
+                yield folder_path, item
+            elif isinstance(item, Sweep):
+                for variant in item.variants():
+                    yield folder_path, variant
+        else:
+            stack.pop()
+
+def _get_exportable_args(exportable: Exportable, config: ExportConfig, export_file_path = None):
     args=[
         config.openscad_location,
-        config.export_file_path
+        export_file_path if export_file_path else config.export_file_path
     ]
     if config.manifold_supported:
         args.append('--backend=Manifold')
@@ -70,51 +101,662 @@ def _get_exportable_args(exportable: Exportable, config: ExportConfig):
 
     return args
 
-def _export_file(folder_path, exportable: Exportable, config: ExportConfig):
+def _get_render_cache(config: ExportConfig):
+    if config.clear_render_cache:
+        RenderCache(config.render_cache_directory).clear()
+        print('Cleared render cache')
+    if not config.use_render_cache:
+        return None
+    source_files = get_dependencies(config.export_file_path, config.openscad_location)
+    if config.debug:
+        print('Render cache sources:\n{}\n'.format('\n'.join(str(source_file) for source_file in source_files)))
+    return RenderCache(
+        config.render_cache_directory,
+        config.render_cache_size_limit,
+        get_sources_hash(source_files),
+        config.openscad_version
+    )
+
+def _get_source_modification_times(config: ExportConfig):
+    if not config.incremental:
+        return None
+    return get_modification_times(get_dependencies(config.export_file_path, config.openscad_location))
+
+def _get_manifest(config: ExportConfig, render_cache: RenderCache):
+    if not config.write_manifest:
+        return None
+    export_map_hash = render_cache.sources_hash if render_cache else get_sources_hash(get_dependencies(config.export_file_path, config.openscad_location))
+    return OutputManifest(config.output_directory, export_map_hash, config.openscad_version)
+
+def _get_preprocessed_export_file(config: ExportConfig, render_cache: RenderCache):
+    if not config.preprocess_export_file:
+        return None
+    if isinstance(config.renderer, RemoteRenderer):
+        print('Skipping export map preprocessing, since remote workers only have the project files')
+        return None
+    try:
+        with config.tracer.span('preprocess'):
+            export_file_path = get_flattened_export_file(config.export_file_path, config.openscad_location, config.preprocessed_directory, render_cache.sources_hash if render_cache else None)
+    except (PreprocessError, OSError, UnicodeDecodeError) as e:
+        print('Skipping export map preprocessing: {}'.format(e))
+        return None
+    if config.debug:
+        print('Preprocessed export map: {}'.format(export_file_path))
+    return str(export_file_path)
+
+def _get_journal(config: ExportConfig):
+    if not config.resume:
+        return None
+    # A journal only applies while the sources and output location are unchanged since it was written.
+    source_modification_times = get_modification_times(get_dependencies(config.export_file_path, config.openscad_location))
+    fingerprint = [config.output_directory] + sorted('{}@{}'.format(source, time) for source, time in source_modification_times.items())
+    return ExportJournal(config.journal_path, fingerprint)
+
+def _get_log_path(relative_path, config: ExportConfig, suffix = '.log'):
+    if not config.log_directory:
+        return None
+    return config.log_directory + relative_path + suffix
+
+def _format_source_names(sources, config: ExportConfig):
+    source_names = []
+    for source in sources:
+        try:
+            source_names.append(str(Path(source).relative_to(config.project_root)))
+        except ValueError:
+            source_names.append(str(source))
+    return ', '.join(source_names)
+
+def _get_file_format(exportable: Exportable, config: ExportConfig):
     file_format = exportable.file_format
     if isinstance(exportable, Model):
         file_format = file_format if file_format else config.default_model_format
+    return file_format
+
+class _ExportJob():
+    # Only the name is kept from the exportable, so planned variants of a sweep can be freed.
+    __slots__ = ('name', 'user_args', 'file_format', 'args', 'output_paths', 'exportable_count')
+
+    def __init__(self, exportable: Exportable, file_format, args):
+        self.name = exportable.name
+        self.user_args = exportable.user_args
+        self.file_format = file_format
+        self.args = args
+        self.output_paths = {}
+        self.exportable_count = 0
+
+    @property
+    def history_key(self):
+        return ' '.join(self.args[2:]) + ' ' + self.file_format
+
+def _plan_jobs(exportables: Folder, config: ExportConfig, archive_paths = None, export_file_path = None):
+    jobs = {}
+    for folder_path, item in _walk_tree(exportables, config.output_naming_format):
+        if isinstance(item, Folder):
+            if item.archive and archive_paths is not None:
+                archive_paths.append(folder_path + _format_path_name('/' + item.name, config.output_naming_format))
+            continue
+        file_format = _get_file_format(item, config)
+        args = _get_exportable_args(item, config, export_file_path)
+        render_key = (file_format, *args)
+        job = jobs.get(render_key)
+        if job is None:
+            job = jobs[render_key] = _ExportJob(item, file_format, args)
+        job.exportable_count += 1
+        # Each output path maps to the path it's a quantity copy of, or None for the first copy in its folder.
+        first_path = None
+        for count in range(1, item.quantity + 1):
+            part_name = _format_part_name(item.file_name, config.output_naming_format, file_format, item.user_args, count)
+            output_path = folder_path + '/' + part_name
+            job.output_paths[output_path] = first_path
+            first_path = first_path if first_path else output_path
+    return list(jobs.values())
+
+_IMAGE_ARG_PREFIXES = ('--camera=', '--colorscheme=', '--imgsize=', '--render=')
+
+def _is_view_batch(jobs):
+    return len(jobs) > 1 and all(job.file_format == '.png' for job in jobs)
+
+def _get_geometry_args(job: _ExportJob):
+    return [arg for arg in job.args if not arg.startswith(_IMAGE_ARG_PREFIXES)]
+
+def _get_view_args(job: _ExportJob, config: ExportConfig, view_file_path):
+    return [config.openscad_location, str(view_file_path)] + [arg for arg in job.args if arg.startswith(_IMAGE_ARG_PREFIXES + ('--backend=',))]
+
+def _batch_jobs(jobs, config: ExportConfig):
+    batch_outputs = config.batch_outputs
+    if batch_outputs and not config.multiple_outputs_supported:
+        print('Not batching outputs, since this version of OpenSCAD only writes one output per run')
+        batch_outputs = False
+    if not batch_outputs and not config.share_image_geometry:
+        return [[job] for job in jobs]
+    # OpenSCAD writes every -o output from a single evaluation of the model, so jobs that only
+    # differ by output format (and at most one set of image settings) can share a process.
+    batches = []
+    output_batches = {}
+    view_batches = {}
+    for job in jobs:
+        geometry_key = tuple(_get_geometry_args(job))
+        if config.share_image_geometry and job.file_format == '.png':
+            view_batches.setdefault(geometry_key, []).append(job)
+        elif batch_outputs:
+            geometry_batches = output_batches.setdefault(geometry_key, [])
+            for batch in geometry_batches:
+                if all(batch_job.file_format != job.file_format for batch_job in batch):
+                    batch.append(job)
+                    break
+            else:
+                geometry_batches.append([job])
+        else:
+            batches.append([job])
+    return batches + [batch for geometry_batches in output_batches.values() for batch in geometry_batches] + list(view_batches.values())
+
+def _schedule_batches(batches, render_history: RenderHistory):
+    if render_history is None:
+        return batches
+    # Starting the longest renders first keeps a slow part from running alone at the end.
+    return sorted(batches, key=lambda batch: max(render_history.estimate(job.history_key, job.name, 'duration') for job in batch), reverse=True)
+
+class _ExportRun():
+    def __init__(self, config: ExportConfig, on_event = None):
+        self.config = config
+        self.render_cache = _get_render_cache(config)
+        self.source_modification_times = _get_source_modification_times(config)
+        # The memory limiter learns per-part peak memory from the render history.
+        self.render_history = RenderHistory(config.render_history_path) if config.use_render_history or config.memory_budget else None
+        self.memory_limiter = MemoryLimiter(config.memory_budget) if config.memory_budget else None
+        self.copies_manifest = CopiesManifest()
+        self.journal = _get_journal(config)
+        self.manifest = _get_manifest(config, self.render_cache)
+        self.manifest_changes = None
+        self.post_process_pool = None
+        # Rendered files waiting for post-processing, removed by _close_run if their job never ran.
+        self.unprocessed_paths = set()
+        self.cancelled = Event()
+        # Each run gets its own local renderer, so cancelling it only kills the processes it started.
+        self.renderer = LocalRenderer() if type(config.renderer) is LocalRenderer else config.renderer
+        # Image views read a mesh from a local temporary directory, which remote workers can't see.
+        self.view_renderer = LocalRenderer() if isinstance(self.renderer, RemoteRenderer) else self.renderer
+        self._on_event = on_event
+
+    def cancel_renders(self, include_shared = True):
+        # Renderers passed in through the config may also be rendering for other exports.
+        for renderer in dict.fromkeys([self.renderer, self.view_renderer]):
+            if include_shared or renderer is not self.config.renderer:
+                renderer.cancel()
+
+    def emit(self, event_type: ExportEventType, path, **kwargs):
+        if self._on_event:
+            self._on_event(ExportEvent(event_type, path, **kwargs))
+
+def _get_batch_args(batch):
+    for job in batch:
+        if job.file_format == '.png':
+            return list(job.args)
+    return list(batch[0].args)
+
+class _PendingJob():
+    __slots__ = ('job', 'relative_paths', 'output_paths', 'copy_sources', 'stale_reason', 'cache_key', 'timings', 'statistics', 'size_report', 'written_relative_paths', 'written_paths', 'content_hash', 'unchanged', 'diagnostics', 'log_path')
+
+    def __init__(self, job: _ExportJob, config: ExportConfig):
+        self.job = job
+        self.relative_paths = list(job.output_paths)
+        self.output_paths = [config.output_directory + relative_path for relative_path in self.relative_paths]
+        self.copy_sources = list(job.output_paths.values())
+        self.stale_reason = ''
+        self.cache_key = None
+        self.timings = {}
+        self.statistics = {}
+        self.size_report = ''
+        self.content_hash = None
+        self.unchanged = False
+        self.diagnostics = {}
+        self.log_path = None
+        # Quantity copies listed in a manifest are never written, so only the first copy in each folder can be checked.
+        if config.duplication_strategy is DuplicationStrategy.MANIFEST:
+            self.written_relative_paths = [relative_path for relative_path, copy_source in job.output_paths.items() if copy_source is None]
+        else:
+            self.written_relative_paths = self.relative_paths
+        self.written_paths = [config.output_directory + relative_path for relative_path in self.written_relative_paths]
+
+def _record_manifest(pending: _PendingJob, run: _ExportRun, render_time = None):
+    if not run.manifest:
+        return
+    render_key = run.manifest.get_render_key(pending.job.name, pending.job.file_format, pending.job.user_args)
+    for relative_path in pending.written_relative_paths:
+        run.manifest.record(relative_path, render_key, render_time, pending.content_hash)
+
+def _finish_job(pending: _PendingJob, run: _ExportRun, status: JobStatus, duration):
+    if status is JobStatus.CACHED:
+        finished_message = 'Finished exporting (cached): '
+    elif pending.unchanged:
+        finished_message = 'Finished exporting (unchanged): '
+    else:
+        finished_message = 'Finished exporting: '
+    run.emit(ExportEventType.FINISHED, pending.relative_paths[0], duration=duration, returncode=0, cached=status is JobStatus.CACHED)
+    output = finished_message + pending.relative_paths[0] + pending.stale_reason + pending.size_report
+    warnings = get_warnings(pending.diagnostics)
+    if warnings:
+        output += ' (warnings: {})'.format(', '.join(warnings))
+    if len(pending.output_paths) > 1:
+        with run.config.tracer.span('copy', path=pending.relative_paths[0], copies=len(pending.output_paths) - 1) as span:
+            for relative_path, copy_path, copy_source in zip(pending.relative_paths[1:], pending.output_paths[1:], pending.copy_sources[1:]):
+                strategy = run.config.duplication_strategy
+                if strategy is DuplicationStrategy.MANIFEST and copy_source is None:
+                    # The same part in another folder is that folder's only copy, so it needs a real file.
+                    strategy = DuplicationStrategy.REFLINK
+                if pending.unchanged and os.path.lexists(copy_path):
+                    # The rendered file didn't change, so neither did its existing copies.
+                    if run.config.incremental and not os.path.islink(copy_path):
+                        os.utime(copy_path)
+                    strategy = None
+                else:
+                    strategy = duplicate(pending.output_paths[0], copy_path, strategy)
+                if strategy is DuplicationStrategy.MANIFEST:
+                    run.copies_manifest.add(copy_source, relative_path)
+                    output += '\nListed in copies manifest: ' + relative_path
+                else:
+                    output += '\nFinished exporting: ' + relative_path
+                run.emit(ExportEventType.COPIED, relative_path)
+        pending.timings['copy'] = span.duration
+    if run.journal:
+        run.journal.record(pending.job.history_key, pending.written_paths)
+    _record_manifest(pending, run, duration if status is JobStatus.FINISHED else None)
+    return JobResult(pending.relative_paths, status, output, 0, duration=duration, timings=pending.timings, statistics=pending.statistics, diagnostics=pending.diagnostics, log_path=pending.log_path)
 
-    output_file_name = _format_part_name(exportable.file_name, config.output_naming_format, file_format, exportable.user_args)
+def _fail_job(pending: _PendingJob, run: _ExportRun, returncode, error, duration):
+    if run.cancelled.is_set():
+        error = 'Cancelled'
+    run.emit(ExportEventType.FAILED, pending.relative_paths[0], duration=duration, returncode=returncode, error=error)
+    if run.cancelled.is_set():
+        return JobResult(pending.relative_paths, JobStatus.CANCELLED, 'Cancelled: ' + pending.relative_paths[0], returncode, error, duration, pending.timings, pending.statistics)
+    output = 'Failed to export: "{}", Error: "{}"'.format(pending.relative_paths[0], error)
+    if pending.log_path:
+        output += '\nFull output: ' + pending.log_path
+    return JobResult(pending.relative_paths, JobStatus.FAILED, output, returncode, error, duration, pending.timings, pending.statistics, pending.diagnostics, pending.log_path)
 
-    formatted_folder_path = _format_path_name(folder_path, config.output_naming_format)
-    output_directory = config.output_directory + formatted_folder_path + '/'
-    Path.mkdir(Path(output_directory), parents=True, exist_ok=True)
+def _prepare_job(job: _ExportJob, run: _ExportRun):
+    config = run.config
+    pending = _PendingJob(job, config)
+    for output_directory in dict.fromkeys(Path(output_path).parent for output_path in pending.output_paths):
+        Path.mkdir(output_directory, parents=True, exist_ok=True)
 
-    args = _get_exportable_args(exportable, config)
-    args.append('-o' + output_directory + output_file_name)
+    if run.journal and run.journal.is_completed(job.history_key, pending.written_paths):
+        run.emit(ExportEventType.SKIPPED, pending.relative_paths[0])
+        _record_manifest(pending, run)
+        return pending, JobResult(pending.relative_paths, JobStatus.RESUMED, 'Already exported: ' + pending.relative_paths[0])
 
+    if run.source_modification_times is not None:
+        stale_sources = get_stale_sources(pending.written_paths, run.source_modification_times)
+        if stale_sources == []:
+            run.emit(ExportEventType.SKIPPED, pending.relative_paths[0])
+            _record_manifest(pending, run)
+            return pending, JobResult(pending.relative_paths, JobStatus.UP_TO_DATE, 'Up to date: ' + pending.relative_paths[0])
+        elif stale_sources is None:
+            pending.stale_reason = ' (output missing)'
+        else:
+            pending.stale_reason = ' (changed: {})'.format(_format_source_names(stale_sources, config))
+
+    if run.render_cache:
+        with config.tracer.span('cache_lookup', path=pending.relative_paths[0]) as span:
+            # Post-processed files are cached, so the steps that produced them are part of the key.
+            cache_args = job.args + ['--post-process={}'.format(step) for step in config.post_processing]
+            pending.cache_key = run.render_cache.get_key(cache_args, job.file_format)
+            cache_hit = run.render_cache.get(pending.cache_key, job.file_format, pending.output_paths[0])
+            span.set_attribute('hit', cache_hit)
+        pending.timings['cache'] = span.duration
+        if cache_hit:
+            if config.debug:
+                print('Render cache hit for {}'.format(pending.relative_paths[0]))
+            return pending, _finish_job(pending, run, JobStatus.CACHED, span.duration)
+    return pending, None
+
+def _replace_output(output_path, pending: _PendingJob, run: _ExportRun):
+    final_path = pending.output_paths[0]
+    if run.manifest:
+        pending.content_hash = hash_file(output_path)
+        # Leave byte-identical outputs untouched, so the manifest and file timestamps only change with the content.
+        if os.path.exists(final_path) and os.path.getsize(final_path) == os.path.getsize(output_path) and run.manifest.get_hash(pending.relative_paths[0]) == pending.content_hash:
+            os.unlink(output_path)
+            pending.unchanged = True
+            if run.config.incremental:
+                # Incremental exports compare output and source modification times, so the output still needs to look current.
+                os.utime(final_path)
+            return
+    os.replace(output_path, final_path)
+
+def _complete_render(pending: _PendingJob, output_path, run: _ExportRun, duration):
+    _replace_output(output_path, pending, run)
+    if run.render_cache:
+        run.render_cache.put(pending.cache_key, pending.job.file_format, pending.output_paths[0])
+    return _finish_job(pending, run, JobStatus.FINISHED, duration)
+
+def _post_process_job(pending: _PendingJob, output_path, run: _ExportRun, duration):
+    # Runs in the post-processing pool, so the render slot is free for the next part in the meantime.
+    run.unprocessed_paths.discard(output_path)
+    try:
+        with run.config.tracer.span('post_process', path=pending.relative_paths[0]) as span:
+            original_size, processed_size = post_process_file(output_path, run.config.post_processing)
+    except Exception as e:
+        # A file that can't be processed, like a truncated 3MF, fails its own job rather than the whole export.
+        Path(output_path).unlink(missing_ok=True)
+        error = 'Post-processing failed: {}'.format(e)
+        pending.diagnostics = merge_diagnostics(pending.diagnostics, {'post-processing': {'severity': 'error', 'count': 1, 'message': error}})
+        return [_fail_job(pending, run, 0, error, duration)]
+    pending.timings['post_process'] = span.duration
+    pending.statistics['original_size'] = original_size
+    pending.statistics['processed_size'] = processed_size
+    if processed_size != original_size:
+        pending.size_report = ' ({} -> {})'.format(format_size(original_size), format_size(processed_size))
+    return [_complete_render(pending, output_path, run, duration)]
+
+def _archive_folder(archive_path, archive_paths, config: ExportConfig):
+    # A parent archive already has the files of its archived subfolders, so it leaves out their archives.
+    subfolder_archives = [config.output_directory + subfolder_path + '.zip' for subfolder_path in archive_paths if subfolder_path.startswith(archive_path + '/')]
+    with config.tracer.span('archive', path=archive_path):
+        _, original_size, archive_size = archive_directory(config.output_directory + archive_path, excluded_paths=subfolder_archives)
+    return 'Archived: {}.zip ({} -> {})'.format(archive_path, format_size(original_size), format_size(archive_size))
+
+def _archive_folders(archive_paths, config: ExportConfig):
+    return [_archive_folder(archive_path, archive_paths, config) for archive_path in archive_paths]
+
+def _write_run_files(run: _ExportRun, archive_paths):
+    # Archives are built last, once every output in their folder has been written, and after the manifests so they include the current ones.
+    config = run.config
+    run.copies_manifest.save(Path(config.output_directory) / 'copies.json')
+    if run.manifest:
+        run.manifest_changes = run.manifest.save()
+    if archive_paths and not run.cancelled.is_set():
+        return _archive_folders(archive_paths, config)
+    return []
+
+def _is_transient_failure(result: RenderResult):
+    # OpenSCAD exits with 1 for errors in the model, which rerunning won't fix. Crashes, kills and lost
+    # workers exit with anything else. A timed out part would most likely just time out again.
+    return result.returncode not in (0, 1) and not result.timed_out
+
+def _get_retry_delay(result: RenderResult, attempt, args, run: _ExportRun):
+    # Returns None when the render shouldn't be retried.
+    config = run.config
+    if attempt == config.retries or run.cancelled.is_set() or not _is_transient_failure(result):
+        return None
+    retry_delay = config.retry_backoff * 2 ** attempt
     if config.debug:
-        print('\nOpenSCAD args for {}:\n{}\n'.format(output_file_name, args))
-
-    process = Popen(args, stdout=PIPE, stderr=PIPE)
-    _, err = process.communicate()
-
-    output = ""
-    if (process.returncode == 0):
-        output = 'Finished exporting: ' + formatted_folder_path + '/' + output_file_name
-        for count in range(2, exportable.quantity + 1):
-            part_copy_name = _format_part_name(exportable.file_name, config.output_naming_format, file_format, exportable.user_args, count)
-            shutil.copy(output_directory + output_file_name, output_directory + part_copy_name)
-            output += '\nFinished exporting: ' + formatted_folder_path + '/' + part_copy_name
+        print('Render failed with exit code {}, retrying in {}s: {}'.format(result.returncode, retry_delay, args))
+    return retry_delay
+
+def _render_with_retries(args, output_paths, run: _ExportRun, renderer: Renderer = None, log_path = None):
+    config = run.config
+    renderer = renderer if renderer else run.renderer
+    for attempt in range(config.retries + 1):
+        # A job picked up just as the export is cancelled would otherwise start after the running processes were killed.
+        if run.cancelled.is_set():
+            return RenderResult(-1), attempt
+        result = renderer.render(args, output_paths, config, monitor_memory=run.render_history is not None, timeout=config.job_timeout, log_path=log_path)
+        retry_delay = _get_retry_delay(result, attempt, args, run)
+        if retry_delay is None or run.cancelled.wait(retry_delay):
+            break
+    return result, attempt + 1
+
+def _estimate_memory(pending_jobs, run: _ExportRun):
+    if not run.memory_limiter:
+        return 0
+    return max(run.render_history.estimate(pending.job.history_key, pending.job.name, 'peak_memory', DEFAULT_RENDER_MEMORY) for pending in pending_jobs)
+
+def _print_render_args(args, output_paths, relative_paths, run: _ExportRun):
+    if run.config.debug:
+        print('\nOpenSCAD args for {}:\n{}\n'.format(', '.join(relative_paths), args + ['-o' + output_path for output_path in output_paths]))
+
+@contextmanager
+def _render_span(args, output_paths, relative_paths, run: _ExportRun, memory_estimate = 0):
+    # Shared by export and export_async. Releases the memory the caller acquired, and removes the outputs
+    # of renders that didn't succeed.
+    span = run.config.tracer.span('render', paths=relative_paths, args=args)
+    try:
+        with span:
+            yield span
+    finally:
+        if memory_estimate:
+            run.memory_limiter.release(memory_estimate)
+        if span.attributes.get('returncode') != 0:
+            for output_path in output_paths:
+                Path(output_path).unlink(missing_ok=True)
+
+def _set_render_result(span, result: RenderResult, attempts):
+    span.set_attribute('returncode', result.returncode)
+    span.set_attribute('attempts', attempts)
+
+def _render(args, output_paths, relative_paths, run: _ExportRun, memory_estimate = 0, renderer: Renderer = None, log_path = None):
+    _print_render_args(args, output_paths, relative_paths, run)
+    if memory_estimate:
+        run.memory_limiter.acquire(memory_estimate)
+    with _render_span(args, output_paths, relative_paths, run, memory_estimate) as span:
+        result, attempts = _render_with_retries(args, output_paths, run, renderer, log_path)
+        _set_render_result(span, result, attempts)
+    return result, span.duration
+
+def _complete_outputs(pending_jobs, output_paths, result: RenderResult, duration, run: _ExportRun, statistics = None):
+    render_history = run.render_history
+    if statistics is None:
+        statistics = parse_render_statistics(result.err.decode('UTF-8', errors='replace'))
+    diagnostics = get_diagnostics(result)
+    results = []
+    for pending, output_path in zip(pending_jobs, output_paths):
+        pending.timings.update(result.timings)
+        pending.statistics = dict(statistics)
+        pending.diagnostics = diagnostics
+        if result.returncode == 0 and not os.path.isfile(output_path):
+            # OpenSCAD can exit cleanly without writing an output, like an -o it didn't support.
+            error = 'OpenSCAD did not write ' + pending.relative_paths[0]
+            pending.diagnostics = merge_diagnostics(diagnostics, {'missing output': {'severity': 'error', 'count': 1, 'message': error}})
+            results.append(_fail_job(pending, run, result.returncode, error, duration))
+        elif result.returncode == 0:
+            if render_history:
+                metrics = {'duration': duration}
+                if result.peak_memory:
+                    metrics['peak_memory'] = result.peak_memory
+                render_history.record(pending.job.history_key, pending.job.name, **metrics)
+            if run.post_process_pool and not run.cancelled.is_set():
+                run.unprocessed_paths.add(output_path)
+                results.append(run.post_process_pool.submit(_post_process_job, pending, output_path, run, duration))
+            else:
+                results.append(_complete_render(pending, output_path, run, duration))
+        else:
+            results.append(_fail_job(pending, run, result.returncode, result.err.decode('UTF-8').strip(), duration))
+    return results
+
+def _export_views(pending_jobs, run: _ExportRun):
+    # Evaluate the model once into a mesh, then take each image of the imported mesh, which skips the model's geometry entirely.
+    with tempfile.TemporaryDirectory() as temp_directory:
+        mesh_path = str(Path(temp_directory) / 'geometry.stl')
+        relative_paths = [pending.relative_paths[0] for pending in pending_jobs]
+        geometry_log_path = _get_log_path(relative_paths[0], run.config, '.geometry.log')
+        for pending in pending_jobs:
+            pending.log_path = geometry_log_path
+        geometry_result, geometry_duration = _render(_get_geometry_args(pending_jobs[0].job), [mesh_path], relative_paths, run, _estimate_memory(pending_jobs, run), log_path=geometry_log_path)
+        if geometry_result.returncode != 0:
+            return _complete_outputs(pending_jobs, [mesh_path] * len(pending_jobs), geometry_result, geometry_duration, run)
+        statistics = parse_render_statistics(geometry_result.err.decode('UTF-8', errors='replace'))
+        view_file_path = Path(temp_directory) / 'views.scad'
+        view_file_path.write_text('import("{}");\n'.format(Path(mesh_path).as_posix()))
+
+        results = []
+        for pending in pending_jobs:
+            pending.timings['geometry'] = geometry_duration
+            output_path = get_temp_path(pending.output_paths[0])
+            pending.log_path = _get_log_path(pending.relative_paths[0], run.config)
+            view_result, view_duration = _render(_get_view_args(pending.job, run.config, view_file_path), [output_path], pending.relative_paths[:1], run, renderer=run.view_renderer, log_path=pending.log_path)
+            # The geometry render is what needs the memory, so it's what the history should learn.
+            view_result.peak_memory = geometry_result.peak_memory
+            # Problems with the model show up in the geometry render, not in the images of its mesh.
+            view_result.diagnostics = merge_diagnostics(get_diagnostics(geometry_result), get_diagnostics(view_result))
+            results.extend(_complete_outputs([pending], [output_path], view_result, geometry_duration / len(pending_jobs) + view_duration, run, statistics))
+    return results
+
+def _prepare_batch(batch, run: _ExportRun):
+    results = []
+    pending_jobs = []
+    if run.cancelled.is_set():
+        return results, pending_jobs
+    for job in batch:
+        pending, result = _prepare_job(job, run)
+        if result:
+            results.append(result)
+        else:
+            pending_jobs.append(pending)
+    for pending in pending_jobs:
+        run.emit(ExportEventType.STARTED, pending.relative_paths[0])
+    return results, pending_jobs
+
+def _get_batch_outputs(pending_jobs, run: _ExportRun):
+    args = _get_batch_args([pending.job for pending in pending_jobs])
+    # OpenSCAD writes to temporary files that are renamed on success, so a killed run never leaves truncated outputs.
+    output_paths = [get_temp_path(pending.output_paths[0]) for pending in pending_jobs]
+    relative_paths = [pending.relative_paths[0] for pending in pending_jobs]
+    # Batched parts share one OpenSCAD process, so they share its log too.
+    log_path = _get_log_path(relative_paths[0], run.config)
+    for pending in pending_jobs:
+        pending.log_path = log_path
+    return args, output_paths, relative_paths, log_path
+
+def _export_batch(batch, run: _ExportRun):
+    results, pending_jobs = _prepare_batch(batch, run)
+    if not pending_jobs:
+        return results
+    if _is_view_batch([pending.job for pending in pending_jobs]):
+        return results + _export_views(pending_jobs, run)
+    args, output_paths, relative_paths, log_path = _get_batch_outputs(pending_jobs, run)
+    result, duration = _render(args, output_paths, relative_paths, run, _estimate_memory(pending_jobs, run), log_path=log_path)
+    return results + _complete_outputs(pending_jobs, output_paths, result, duration, run)
+
+def _cancel(run: _ExportRun, futures):
+    run.cancelled.set()
+    for future in futures:
+        future.cancel()
+    # Queued jobs never start, and the ones already rendering are killed along with any children.
+    run.cancel_renders()
+
+class _Terminated(SystemExit):
+    pass
+
+def _raise_terminated(signal_number, frame):
+    raise _Terminated(128 + signal_number)
+
+def _install_termination_handlers():
+    # Renders run in process groups of their own, so they would outlive an export that's killed without cleaning up.
+    if current_thread() is not main_thread():
+        return {}
+    previous_handlers = {}
+    for signal_name in ('SIGTERM', 'SIGHUP'):
+        if hasattr(signal, signal_name):
+            signal_number = getattr(signal, signal_name)
+            previous_handlers[signal_number] = signal.signal(signal_number, _raise_terminated)
+    return previous_handlers
+
+def _restore_signal_handlers(previous_handlers):
+    for signal_number, handler in previous_handlers.items():
+        signal.signal(signal_number, handler)
+
+def _start_run(exportables: Folder, config: ExportConfig, on_event):
+    print('Starting export')
+    run = _ExportRun(config, on_event)
+    archive_paths = []
+    jobs = _plan_jobs(exportables, config, archive_paths, _get_preprocessed_export_file(config, run.render_cache))
+    if config.post_processing:
+        run.post_process_pool = ThreadPoolExecutor(max_workers = config.post_process_parallelism)
+    saved_render_count = sum(job.exportable_count - 1 for job in jobs)
+    if saved_render_count:
+        print('Skipping {} duplicate renders'.format(saved_render_count))
+    batches = _schedule_batches(_batch_jobs(jobs, config), run.render_history)
+    for batch in batches:
+        for job in batch:
+            run.emit(ExportEventType.QUEUED, next(iter(job.output_paths)))
+    return run, jobs, archive_paths, saved_render_count, batches
+
+def _record_result(result: JobResult, run: _ExportRun, results):
+    print(result.message)
+    results.append(result)
+    # Returns whether the rest of the export should be cancelled.
+    if run.config.fail_fast and result.status is JobStatus.FAILED and not run.cancelled.is_set():
+        print('Cancelling remaining jobs after a failed export')
+        return True
+    return False
+
+def _close_run(run: _ExportRun, jobs, results):
+    if run.post_process_pool:
+        run.post_process_pool.shutdown(cancel_futures=True)
+        for output_path in list(run.unprocessed_paths):
+            Path(output_path).unlink(missing_ok=True)
+    if run.journal:
+        # Keep the journal until every job has succeeded so a rerun only repeats unfinished work.
+        run.journal.close(finished=len(results) == len(jobs) and all(result.status is not JobStatus.FAILED for result in results))
+
+def _finish_run(run: _ExportRun, jobs, results, saved_render_count, start_time):
+    config = run.config
+    if config.post_processing:
+        processed_results = [result for result in results if 'original_size' in result.statistics]
+        if processed_results:
+            print('Post-processing reduced outputs from {} to {}'.format(
+                format_size(sum(result.statistics['original_size'] for result in processed_results)),
+                format_size(sum(result.statistics['processed_size'] for result in processed_results))
+            ))
+    if run.render_history:
+        run.render_history.save()
+    changes = run.manifest_changes
+    if changes:
+        print('Manifest: {} added, {} changed, {} removed'.format(len(changes['added']), len(changes['changed']), len(changes['removed'])))
+    if config.debug and results:
+        print(format_slowest_report(results))
+    triage_report = format_triage_report(results)
+    if triage_report:
+        print(triage_report)
+    if config.log_directory and results:
+        print('OpenSCAD output written to: ' + config.log_directory)
+    unfinished_count = len(jobs) - sum(1 for result in results if result.status is not JobStatus.CANCELLED)
+    cancelled = run.cancelled.is_set() and unfinished_count > 0
+    if cancelled:
+        print('Export cancelled, {} of {} jobs did not finish'.format(unfinished_count, len(jobs)))
     else:
-        output = 'Failed to export: "{}/{}", Error: "{}"'.format(formatted_folder_path, output_file_name, err.decode('UTF-8').strip())
-    return output
+        print('Done!')
+    return ExportSummary(results, saved_render_count, time.perf_counter() - start_time, cancelled, changes)
 
-def export(exportables: Folder, config: ExportConfig = None):
+def export(exportables: Folder, config: ExportConfig = None, on_event = None):
     if config is None:
         config = ExportConfig()
 
     if config.initialized:
         with ThreadPoolExecutor(max_workers = config.parallelism) as executor:
-            print('Starting export')
-            futures = []
-            paths_and_exportables = _flatten_paths(exportables)
-            for path, path_exportables in paths_and_exportables.items():
-                for exportable in path_exportables:
-                    futures.append(executor.submit(_export_file, path, exportable, config))
-            for future in futures:
-                print(future.result())
-            print('Done!')
+            start_time = time.perf_counter()
+            run, jobs, archive_paths, saved_render_count, batches = _start_run(exportables, config, on_event)
+            futures = set()
+            results = []
+            deadline = start_time + config.timeout if config.timeout else None
+            previous_handlers = _install_termination_handlers()
+            try:
+                futures.update(executor.submit(_export_batch, batch, run) for batch in batches)
+                while futures:
+                    wait_timeout = max(0, deadline - time.perf_counter()) if deadline and not run.cancelled.is_set() else None
+                    done, futures = wait(futures, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        print('Export timed out after {} seconds, cancelling remaining jobs'.format(config.timeout))
+                        _cancel(run, futures)
+                    for future in done:
+                        if future.cancelled():
+                            continue
+                        for result in future.result():
+                            # Renders hand successful outputs to the post-processing pool and finish when it does.
+                            if isinstance(result, Future):
+                                futures.add(result)
+                            elif _record_result(result, run, results):
+                                _cancel(run, futures)
+                for message in _write_run_files(run, archive_paths):
+                    print(message)
+            except (KeyboardInterrupt, _Terminated):
+                print('Export interrupted, cancelling remaining jobs')
+                _cancel(run, futures)
+                raise
+            finally:
+                _restore_signal_handlers(previous_handlers)
+                _close_run(run, jobs, results)
+        return _finish_run(run, jobs, results, saved_render_count, start_time)
     else:
         print('Export skipped because config was not initialized.')
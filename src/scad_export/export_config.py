@@ -1,20 +1,37 @@
+import argparse
 import json
 import os
 import platform
 import re
 import shutil
 import sys
+import tempfile
 import traceback
 from enum import StrEnum, auto
 from functools import cached_property
 from pathlib import Path
-from subprocess import PIPE, Popen
+from subprocess import DEVNULL, PIPE, Popen
 from threading import Lock
 
+from .config_cache import CapabilityCache, FileIndex
+from .duplication import DuplicationStrategy
 from .exportable import ColorScheme, ImageSize, ModelFormat
-from .user_input import DirectoryPicker, FilePicker, Validation, option_prompt
+from .instrumentation import Tracer
+from .post_process import PostProcess
+from .renderers import LocalRenderer, Renderer
+from .user_input import Validation
 
 
+_ENVIRONMENT_VARIABLES = {
+    'openscad_location': 'SCAD_EXPORT_OPENSCAD_LOCATION',
+    'project_root': 'SCAD_EXPORT_PROJECT_ROOT',
+    'export_file_path': 'SCAD_EXPORT_EXPORT_FILE',
+    'output_directory': 'SCAD_EXPORT_OUTPUT_DIRECTORY'
+}
+
+class ConfigError(Exception):
+    pass
+
 class NamingFormat(StrEnum):
     NONE = auto()
     TITLE_CASE = auto()
@@ -30,7 +47,37 @@ class ExportConfig:
         default_image_color_scheme: ColorScheme = ColorScheme.CORNFIELD,
         default_image_size: ImageSize = ImageSize(),
         parallelism = os.cpu_count(),
-        debug = False
+        debug = False,
+        use_render_cache = False,
+        render_cache_directory = None,
+        render_cache_size_limit = 2 * 1024 ** 3,
+        incremental = False,
+        use_render_history = False,
+        memory_budget = None,
+        renderer: Renderer = None,
+        batch_outputs = False,
+        tracer: Tracer = None,
+        interactive = None,
+        config_file = None,
+        openscad_location = None,
+        project_root = None,
+        export_file_path = None,
+        output_directory = None,
+        entry_point = None,
+        duplication_strategy: DuplicationStrategy = DuplicationStrategy.REFLINK,
+        resume = False,
+        post_processing: list[PostProcess] = None,
+        post_process_parallelism = 1,
+        job_timeout = None,
+        timeout = None,
+        retries = 0,
+        retry_backoff = 1,
+        fail_fast = False,
+        share_image_geometry = False,
+        write_manifest = False,
+        log_directory = None,
+        preprocess_export_file = False,
+        clear_render_cache = False
     ):
         self.output_naming_format = output_naming_format
         self.default_model_format = default_model_format
@@ -38,6 +85,41 @@ class ExportConfig:
         self.default_image_size = default_image_size
         self.parallelism = parallelism
         self.debug = debug
+        self.use_render_cache = use_render_cache
+        self._render_cache_directory = render_cache_directory
+        self.render_cache_size_limit = render_cache_size_limit
+        self.clear_render_cache = clear_render_cache
+        self.incremental = incremental
+        self.use_render_history = use_render_history
+        self.memory_budget = memory_budget
+        self.renderer = renderer if renderer else LocalRenderer()
+        self.batch_outputs = batch_outputs
+        self.tracer = tracer if tracer else Tracer()
+        self.duplication_strategy = duplication_strategy
+        self.resume = resume
+        self.post_processing = post_processing if post_processing else []
+        self.post_process_parallelism = post_process_parallelism
+        self.job_timeout = job_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.fail_fast = fail_fast
+        self.share_image_geometry = share_image_geometry
+        self.write_manifest = write_manifest
+        self.log_directory = str(log_directory) if log_directory else None
+        self.preprocess_export_file = preprocess_export_file
+        if interactive is None:
+            interactive = os.environ.get('SCAD_EXPORT_INTERACTIVE', '0' if os.environ.get('CI') else '1') != '0'
+        self.interactive = interactive
+        self._config_file = config_file if config_file else os.environ.get('SCAD_EXPORT_CONFIG')
+        overrides = {
+            'openscad_location': openscad_location,
+            'project_root': project_root,
+            'export_file_path': export_file_path,
+            'output_directory': output_directory
+        }
+        self._entry_point = entry_point
+        self._overrides = {name: value if value else os.environ.get(_ENVIRONMENT_VARIABLES[name]) for name, value in overrides.items()}
 
         try:
             self._config = self._load_from_drive()
@@ -52,18 +134,48 @@ class ExportConfig:
             print('Failed to initialize config: {}'.format(e))
             if debug:
                 print(traceback.format_exc())
+            if not self.interactive:
+                raise
 
     @cached_property
     def _entry_point_script_directory(self):
-        return Path(sys.modules['__main__'].__file__).resolve().parent
+        # Interactive sessions and python -c have no script file, so fall back to the working directory.
+        main_file = self._entry_point if self._entry_point else getattr(sys.modules['__main__'], '__file__', None)
+        return Path(main_file).resolve().parent if main_file else Path.cwd()
 
     @cached_property
     def _entry_point_script_name(self):
-        return re.split('/|\\\\', sys.modules['__main__'].__file__)[-1][0:-3]
+        main_file = str(self._entry_point) if self._entry_point else getattr(sys.modules['__main__'], '__file__', None)
+        return re.split('/|\\\\', main_file)[-1][0:-3] if main_file else 'scad_export'
+
+    @cached_property
+    def _data_directory(self):
+        return Path(self._entry_point_script_directory) / '.scad_export'
+
+    @cached_property
+    def render_cache_directory(self):
+        if self._render_cache_directory:
+            return Path(self._render_cache_directory)
+        return self._data_directory / 'render_cache'
+
+    @cached_property
+    def preprocessed_directory(self):
+        return self._data_directory / 'preprocessed'
+
+    @cached_property
+    def render_history_path(self):
+        return self._data_directory / 'render_history.json'
+
+    @cached_property
+    def journal_path(self):
+        return self._data_directory / '{} journal.jsonl'.format(self._entry_point_script_name)
 
     @cached_property
     def _config_path(self):
-        path = Path(self._entry_point_script_directory) / 'export config.json'
+        if self._config_file:
+            path = Path(self._config_file)
+        else:
+            path = Path(self._entry_point_script_directory) / 'export config.json'
         if self.debug:
             print('Using config path: {}'.format(path))
         return path
@@ -85,16 +197,20 @@ class ExportConfig:
             with open(self._config_path, 'w+') as file:
                 json.dump(self._config, file, indent=2)
 
+    @cached_property
+    def _project_file_index(self):
+        return FileIndex(self.project_root, self._data_directory / 'file_index.json')
+
+    @cached_property
+    def _capability_cache(self):
+        return CapabilityCache(self._data_directory / 'capabilities.json')
+
     def _get_export_file_names(self):
-        matching_files = []
-        for _, _, files in os.walk(self.project_root):
-            for file_name in files:
-                if file_name.endswith('export map.scad'):
-                    matching_files.append(file_name)
-        return matching_files
+        return [os.path.basename(file_path) for file_path in self._project_file_index.files if file_path.endswith('export map.scad')]
 
     def _get_config_value(self, key):
-        value = self._config.get(key, '')
+        # Shared config files may use keys without the entry point script prefix.
+        value = self._config.get(key, '') or self._config.get(key.split('.')[-1], '')
         if self.debug and value:
             print('Found saved value "{}" = "{}"'.format(key, value))
         elif self.debug and not value:
@@ -123,79 +239,124 @@ class ExportConfig:
         finally:
             return git_root
 
+    def _resolve_value(self, name, config_key, validation: Validation, prompt, saved_validation: Validation = None):
+        override = self._overrides.get(name)
+        if override:
+            value = validation.is_valid(override)
+            if not value:
+                raise ConfigError('Invalid {} "{}"'.format(name, override))
+            return str(value)
+        saved_validation = saved_validation if saved_validation else validation
+        if not saved_validation.is_valid(self._get_config_value(config_key)):
+            if not self.interactive:
+                raise ConfigError('No valid {} configured. Set it with the {} environment variable, the --{} argument or the config file.'.format(
+                    name, _ENVIRONMENT_VARIABLES[name], name.replace('_', '-')))
+            self._persist(config_key, prompt())
+        return self._get_config_value(config_key)
+
+    def _prompt_openscad_location(self, validation: Validation):
+        from .user_input import FilePicker, option_prompt
+        options = [
+            'openscad',
+            'C:\\Program Files\\OpenSCAD (Nightly)\\openscad.exe',
+            'C:\\Program Files\\OpenSCAD\\openscad.exe',
+            '/Applications/OpenSCAD.app',
+            '~/Applications/OpenSCAD.app'
+        ]
+        file_type = ('OpenSCAD Executable', '*.*')
+        if platform.system() == 'Windows':
+            file_type = ('OpenSCAD .exe', '*.exe')
+        if platform.system() == 'Darwin':
+            file_type = ('OpenSCAD .app', '*.*')
+        picker = FilePicker('/', window_title='Choose OpenSCAD Executable', file_types=[file_type])
+        return option_prompt('OpenSCAD executable location', validation, options, picker)
+
     @cached_property
     def openscad_location(self):
-        open_scad_location_name = 'openScadLocation'
         validation = Validation(_is_openscad_path_valid)
+        return self._resolve_value('openscad_location', 'openScadLocation', validation, lambda: self._prompt_openscad_location(validation))
 
-        if not validation.is_valid(self._get_config_value(open_scad_location_name)):
-            options = [
-                'openscad',
-                'C:\\Program Files\\OpenSCAD (Nightly)\\openscad.exe',
-                'C:\\Program Files\\OpenSCAD\\openscad.exe',
-                '/Applications/OpenSCAD.app',
-                '~/Applications/OpenSCAD.app'
-            ]
-            file_type = ('OpenSCAD Executable', '*.*')
-            if platform.system() == 'Windows':
-                file_type = ('OpenSCAD .exe', '*.exe')
-            if platform.system() == 'Darwin':
-                file_type = ('OpenSCAD .app', '*.*')
-            picker = FilePicker('/', window_title='Choose OpenSCAD Executable', file_types=[file_type])
-            openscad_location = option_prompt('OpenSCAD executable location', validation, options, picker)
-            self._persist(open_scad_location_name, openscad_location)
-        return self._get_config_value(open_scad_location_name)
+    def _prompt_project_root(self, validation: Validation):
+        from .user_input import DirectoryPicker, option_prompt
+        current_script_dir = self._entry_point_script_directory
+        picker = DirectoryPicker(current_script_dir, window_title='Choose Project Root Directory')
+        return option_prompt('project root folder', validation, [self._git_project_root if self._git_project_root else current_script_dir], picker)
 
     @cached_property
     def project_root(self):
-        project_root_name = 'projectRoot'
         validation = Validation(_is_directory)
-        if not validation.is_valid(self._get_config_value(project_root_name)):
-            current_script_dir = self._entry_point_script_directory
-            picker = DirectoryPicker(current_script_dir, window_title='Choose Project Root Directory')
-            project_root = option_prompt('project root folder', validation, [self._git_project_root if self._git_project_root else current_script_dir], picker)
-            self._persist(project_root_name, project_root)
-        return self._get_config_value(project_root_name)
+        return self._resolve_value('project_root', 'projectRoot', validation, lambda: self._prompt_project_root(validation))
+
+    def _prompt_export_file_path(self, validation: Validation):
+        from .user_input import FilePicker, option_prompt
+        valid_export_files = self._get_export_file_names()
+        if self.debug:
+            print('Found export files: ' + ', '.join(valid_export_files))
+        picker = FilePicker(self.project_root, window_title='Choose Export Map File', file_types=[('Export Map .scad', '*.scad')])
+        return option_prompt('export map file', validation, valid_export_files, picker)
 
     @cached_property
     def export_file_path(self):
-        config_key = self._entry_point_script_name + '.exportMapFile'
-        if not os.path.isfile(self._get_config_value(config_key)):
-            valid_export_files = self._get_export_file_names()
-            if self.debug:
-                print('Found export files: ' + ', '.join(valid_export_files))
+        validation = Validation(_is_file_with_extension, file_extension='.scad', file_index=self._project_file_index)
+        saved_validation = Validation(os.path.isfile)
+        return self._resolve_value('export_file_path', self._entry_point_script_name + '.exportMapFile', validation, lambda: self._prompt_export_file_path(validation), saved_validation)
 
-            validation = Validation(_is_file_with_extension, file_extension='.scad', search_directory=self.project_root)
-            picker = FilePicker(self.project_root, window_title='Choose Export Map File', file_types=[('Export Map .scad', '*.scad')])
-            value = option_prompt('export map file', validation, valid_export_files, picker)
-            self._persist(config_key, value)
-        return self._get_config_value(config_key)
+    def _prompt_output_directory(self, validation: Validation):
+        from .user_input import DirectoryPicker, option_prompt
+        options = [
+            os.path.join(os.path.expanduser('~'), 'Desktop'),
+            os.path.expanduser('~'),
+            self.project_root
+        ]
+        picker = DirectoryPicker(os.path.expanduser('~'), window_title='Choose Output Directory')
+        return option_prompt('output directory', validation, options, picker)
 
     @cached_property
     def output_directory(self):
-        config_key = self._entry_point_script_name + '.outputDirectory'
-        output_directory = self._get_config_value(config_key)
         validation = Validation(_is_directory_writable)
-        if not validation.is_valid(output_directory):
-            options = [
-                os.path.join(os.path.expanduser('~'), 'Desktop'),
-                os.path.expanduser('~'),
-                self.project_root
-            ]
-            picker = DirectoryPicker(os.path.expanduser('~'), window_title='Choose Output Directory')
-            stl_output_directory = option_prompt('output directory', validation, options, picker)
-            self._persist(config_key, stl_output_directory)
-        return self._get_config_value(config_key)
+        return self._resolve_value('output_directory', self._entry_point_script_name + '.outputDirectory', validation, lambda: self._prompt_output_directory(validation))
 
-    @cached_property
-    def manifold_supported(self):
+    def _probe_manifold_supported(self):
         process = Popen([self.openscad_location, '-h'], stdout=PIPE, stderr=PIPE)
         _, out = process.communicate()
-        is_manifold_supported = 'manifold' in str(out).lower()
+        return 'manifold' in str(out).lower()
+
+    def _probe_openscad_version(self):
+        process = Popen([self.openscad_location, '--version'], stdout=PIPE, stderr=PIPE)
+        out, err = process.communicate()
+        return (str(out, encoding='UTF-8') + str(err, encoding='UTF-8')).strip()
+
+    @cached_property
+    def manifold_supported(self):
+        is_manifold_supported = self._capability_cache.get(self.openscad_location, 'manifold_supported', self._probe_manifold_supported)
         if (self.debug):
             print('Manifold supported: {}'.format(is_manifold_supported))
         return is_manifold_supported
 
+    def _probe_multiple_outputs_supported(self):
+        # Older versions only write the last -o output, without an error.
+        with tempfile.TemporaryDirectory() as temp_directory:
+            temp_directory = Path(temp_directory)
+            (temp_directory / 'probe.scad').write_text('cube(1);\n')
+            output_paths = [temp_directory / 'probe.stl', temp_directory / 'probe.off']
+            process = Popen([self.openscad_location, str(temp_directory / 'probe.scad')] + ['-o' + str(output_path) for output_path in output_paths], stdout=DEVNULL, stderr=DEVNULL)
+            process.wait()
+            return process.returncode == 0 and all(output_path.is_file() for output_path in output_paths)
+
+    @cached_property
+    def multiple_outputs_supported(self):
+        is_multiple_outputs_supported = self._capability_cache.get(self.openscad_location, 'multiple_outputs_supported', self._probe_multiple_outputs_supported)
+        if (self.debug):
+            print('Multiple outputs supported: {}'.format(is_multiple_outputs_supported))
+        return is_multiple_outputs_supported
+
+    @cached_property
+    def openscad_version(self):
+        version = self._capability_cache.get(self.openscad_location, 'version', self._probe_openscad_version)
+        if (self.debug):
+            print('OpenSCAD version: {}'.format(version))
+        return version
+
 def _is_openscad_path_valid(path):
     path = Path(path).resolve(strict=False)
     # If MacOS and executable not found, try pathing to it in .app package.
@@ -210,14 +371,28 @@ def _is_directory(directory):
 def _is_directory_writable(directory):
     return directory if _is_directory(directory) and os.access(directory, os.W_OK) else ''
 
-def _get_file_path(search_directory, file_name):
-    for root, _, files in os.walk(search_directory):
-        if file_name in files:
-            file_path = Path(root).joinpath(file_name).resolve(strict=False)
-    return file_path
-
-def _is_file_with_extension(file_name, file_extension, search_directory):
+def _is_file_with_extension(file_name, file_extension, file_index: FileIndex):
     file_path = Path(file_name)
     if not file_path.exists():
-        file_path = _get_file_path(search_directory, file_name)
+        file_path = file_index.find(file_name)
+        file_path = Path(file_path).resolve(strict=False) if file_path else ''
     return str(file_path) if file_path and str(file_path).lower().endswith(file_extension) else ''
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--openscad-location', help='OpenSCAD executable. Overrides {}.'.format(_ENVIRONMENT_VARIABLES['openscad_location']))
+    parser.add_argument('--project-root', help='Project root directory. Overrides {}.'.format(_ENVIRONMENT_VARIABLES['project_root']))
+    parser.add_argument('--export-file-path', help='Export map .scad file. Overrides {}.'.format(_ENVIRONMENT_VARIABLES['export_file_path']))
+    parser.add_argument('--output-directory', help='Output directory. Overrides {}.'.format(_ENVIRONMENT_VARIABLES['output_directory']))
+    parser.add_argument('--config-file', help='Config JSON file to read saved values from. Overrides SCAD_EXPORT_CONFIG.')
+    parser.add_argument('--non-interactive', action='store_true', help='Fail instead of prompting when a value is missing.')
+    return parser
+
+def config_arguments(arguments: argparse.Namespace):
+    return {
+        'openscad_location': arguments.openscad_location,
+        'project_root': arguments.project_root,
+        'export_file_path': arguments.export_file_path,
+        'output_directory': arguments.output_directory,
+        'config_file': arguments.config_file,
+        'interactive': False if arguments.non_interactive else None
+    }
@@ -1,5 +1,6 @@
+import copy
 from enum import StrEnum
-from itertools import chain
+from itertools import chain, product
 
 
 class ModelFormat(StrEnum):
@@ -23,23 +24,31 @@ class ColorScheme(StrEnum):
     MONOTONE = 'Monotone'
 
 class ImageSize():
+    __slots__ = ('width', 'height')
+
     def __init__(self, width = 1600, height = 900):
         self.width = width
         self.height = height
 
 class Folder():
-    def __init__(self, name, contents):
+    __slots__ = ('name', 'contents', 'archive')
+
+    def __init__(self, name, contents, archive = False):
         self.name = name
+        self.archive = archive
         self.contents = self._flatten(contents)
 
     def _flatten(self, contents):
+        # A tuple rather than an iterator, so the same tree can be planned and exported more than once.
         if isinstance(contents, list):
             wrapped_items = [item if isinstance(item, list) else [item] for item in contents]
-            return chain.from_iterable(wrapped_items)
+            return tuple(chain.from_iterable(wrapped_items))
         else:
-            return [contents]
+            return (contents,)
 
 class Exportable():
+    __slots__ = ('name', 'file_name', 'file_format', 'quantity', 'user_args')
+
     def __init__(self, name, file_format, file_name = None, quantity = 1, **kwargs):
         self.name = name
         self.file_name = file_name if file_name else name
@@ -48,19 +57,58 @@ class Exportable():
         self.user_args = kwargs if kwargs else {}
 
 class Model(Exportable):
+    __slots__ = ()
+
     def __init__(self, name, file_name = None, quantity = 1, format: ModelFormat = None, **kwargs):
         self.quantity = quantity
         super().__init__(name, format.value if format else '', file_name, quantity, **kwargs)
 
 class Drawing(Exportable):
+    __slots__ = ()
+
     def __init__(self, name, file_name = None, quantity = 1, **kwargs):
         self.quantity = quantity
         super().__init__(name, '.dxf', file_name, quantity, **kwargs)
 
 class Image(Exportable):
+    __slots__ = ('image_size', 'color_scheme', 'camera_position')
+
     def __init__(self, name, camera_position, file_name = None, image_size: ImageSize = None, color_scheme = None, **kwargs):
         self.name = name
         self.image_size = image_size
         self.color_scheme = color_scheme
         self.camera_position = camera_position
         super().__init__(name = name, file_format = '.png', file_name = file_name, **kwargs)
+
+class Sweep():
+    __slots__ = ('template', 'sweep_args', 'include', 'exclude')
+
+    # Each keyword is a user arg and the values to sweep it over, e.g. Sweep(Model('cube'), x=range(10, 50, 10), y=[5, 10]).
+    def __init__(self, template: Exportable, include = None, exclude = None, **kwargs):
+        self.template = template
+        self.sweep_args = kwargs
+        self.include = include
+        self.exclude = exclude
+
+    def _matches(self, variant_filter, args):
+        # A filter is either a function of the variant's args, or a list of partial args to match.
+        if callable(variant_filter):
+            return variant_filter(args)
+        return any(all(args.get(key) == value for key, value in partial_args.items()) for partial_args in variant_filter)
+
+    def is_included(self, args):
+        if self.include is not None and not self._matches(self.include, args):
+            return False
+        return self.exclude is None or not self._matches(self.exclude, args)
+
+    def variant(self, args):
+        variant = copy.copy(self.template)
+        variant.user_args = {**self.template.user_args, **args}
+        return variant
+
+    def variants(self):
+        keys = list(self.sweep_args)
+        for values in product(*self.sweep_args.values()):
+            args = dict(zip(keys, values))
+            if self.is_included(args):
+                yield self.variant(args)
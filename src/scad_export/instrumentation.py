@@ -0,0 +1,59 @@
+import re
+import time
+
+_RENDER_TIME_PATTERN = re.compile(r'Total rendering time:\s*(\d+):(\d+):([\d.]+)')
+_STATISTIC_PATTERN = re.compile(r'^\s*(Vertices|Facets|Halfedges|Edges|Volumes|Genus):\s*(\d+)', re.MULTILINE)
+
+
+class Span():
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start_time = None
+        self.duration = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        self.tracer.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start_time
+        if exc_value is not None:
+            self.set_attribute('error', str(exc_value))
+        self.tracer.on_end(self)
+        return False
+
+class Tracer():
+    # Subclass and override on_start/on_end to forward spans to a profiler or tracing backend.
+    def span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+def parse_render_statistics(stderr):
+    statistics = {}
+    render_time = _RENDER_TIME_PATTERN.search(stderr)
+    if render_time:
+        hours, minutes, seconds = render_time.groups()
+        statistics['render_time'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    for name, value in _STATISTIC_PATTERN.findall(stderr):
+        statistics[name.lower()] = int(value)
+    return statistics
+
+def format_slowest_report(results, count = 10):
+    slowest = sorted(results, key=lambda result: result.duration, reverse=True)[:count]
+    lines = ['Slowest parts:']
+    for result in slowest:
+        phases = ', '.join('{} {:.2f}s'.format(phase, seconds) for phase, seconds in result.timings.items())
+        statistics = ', '.join('{} {}'.format(name, value) for name, value in result.statistics.items())
+        lines.append('  {:.2f}s {} [{}]{}'.format(result.duration, result.output_paths[0], phases, ' (' + statistics + ')' if statistics else ''))
+    return '\n'.join(lines)
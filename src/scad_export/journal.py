@@ -0,0 +1,69 @@
+import json
+import os
+from pathlib import Path
+from threading import Lock
+
+
+class ExportJournal():
+    def __init__(self, path, fingerprint):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self._lock = Lock()
+        self._completed = self._load()
+        self._file = None
+
+    def _load(self):
+        completed = {}
+        try:
+            with open(self.path, 'r') as file:
+                lines = file.readlines()
+        except OSError:
+            return completed
+        try:
+            if not lines or json.loads(lines[0]).get('fingerprint') != self.fingerprint:
+                return completed
+            for line in lines[1:]:
+                entry = json.loads(line)
+                completed[entry['key']] = entry
+        except ValueError:
+            # A line cut short by a crash ends the journal; everything before it is still valid.
+            pass
+        return completed
+
+    def _open(self):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'w')
+            self._write({'fingerprint': self.fingerprint})
+            for entry in self._completed.values():
+                self._write(entry)
+        return self._file
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_completed(self, key, output_paths):
+        entry = self._completed.get(key)
+        if entry is None or entry['paths'] != output_paths:
+            return False
+        try:
+            return os.path.getmtime(output_paths[0]) == entry['mtime'] and all(os.path.lexists(output_path) for output_path in output_paths)
+        except OSError:
+            return False
+
+    def record(self, key, output_paths):
+        entry = {'key': key, 'paths': output_paths, 'mtime': os.path.getmtime(output_paths[0])}
+        with self._lock:
+            self._open()
+            self._completed[key] = entry
+            self._write(entry)
+
+    def close(self, finished):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if finished:
+                self.path.unlink(missing_ok=True)
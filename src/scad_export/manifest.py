@@ -0,0 +1,130 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+
+from .duplication import get_temp_path
+from .render_cache import _hash_file
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+def hash_file(file_path):
+    hasher = hashlib.sha256()
+    _hash_file(file_path, hasher)
+    return hasher.hexdigest()
+
+def load_manifest(directory):
+    try:
+        with open(Path(directory) / MANIFEST_FILE_NAME, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+def diff_manifests(previous, current):
+    previous_files = previous.get('files', {})
+    current_files = current.get('files', {})
+    return {
+        'added': sorted(name for name in current_files if name not in previous_files),
+        'changed': sorted(name for name, entry in current_files.items() if name in previous_files and previous_files[name].get('sha256') != entry['sha256']),
+        'removed': sorted(name for name in previous_files if name not in current_files)
+    }
+
+class OutputManifest():
+    def __init__(self, output_directory, export_map_hash = '', openscad_version = ''):
+        self.output_directory = output_directory
+        self.export_map_hash = export_map_hash
+        self.openscad_version = openscad_version
+        self._entries = {}
+        self._previous_manifests = {}
+        self._lock = Lock()
+
+    def _previous_manifest(self, directory):
+        with self._lock:
+            if directory not in self._previous_manifests:
+                self._previous_manifests[directory] = load_manifest(directory)
+            return self._previous_manifests[directory]
+
+    def get_hash(self, relative_path):
+        output_path = self.output_directory + relative_path
+        directory, name = os.path.split(output_path)
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return None
+        # A file with the size and modification time the last manifest saw hasn't been rewritten, so skip hashing it again.
+        entry = self._previous_manifest(directory).get('files', {}).get(name)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            return entry['sha256']
+        return hash_file(output_path)
+
+    def get_render_key(self, name, file_format, user_args):
+        return {
+            'name': name,
+            'file_format': file_format,
+            'user_args': user_args,
+            'export_map_hash': self.export_map_hash,
+            'openscad_version': self.openscad_version
+        }
+
+    def record(self, relative_path, render_key, render_time = None, content_hash = None):
+        with self._lock:
+            self._entries[relative_path] = (render_key, render_time, content_hash)
+
+    def _build_manifest(self, relative_directory, recorded_entries):
+        directory = self.output_directory + relative_directory
+        previous_files = self._previous_manifest(directory).get('files', {})
+        # Files from earlier runs that weren't part of this one, e.g. because of a filter, are kept while they exist.
+        files = {name: entry for name, entry in previous_files.items() if name not in recorded_entries and os.path.exists(os.path.join(directory, name))}
+        for name, (render_key, render_time, content_hash) in recorded_entries.items():
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            files[name] = {
+                'sha256': content_hash if content_hash else self.get_hash(relative_directory + '/' + name),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'render_key': render_key,
+                'render_time': render_time if render_time is not None else previous_files.get(name, {}).get('render_time')
+            }
+        return {'files': dict(sorted(files.items()))}
+
+    def save(self):
+        entries_by_directory = {}
+        for relative_path, entry in self._entries.items():
+            relative_directory, name = relative_path.rsplit('/', 1)
+            entries_by_directory.setdefault(relative_directory, {})[name] = entry
+        changes = {'added': [], 'changed': [], 'removed': []}
+        for relative_directory, recorded_entries in entries_by_directory.items():
+            directory = self.output_directory + relative_directory
+            manifest = self._build_manifest(relative_directory, recorded_entries)
+            manifest['changes'] = diff_manifests(self._previous_manifest(directory), manifest)
+            manifest_path = Path(directory) / MANIFEST_FILE_NAME
+            temp_path = get_temp_path(manifest_path)
+            with open(temp_path, 'w') as file:
+                json.dump(manifest, file, indent=2)
+            os.replace(temp_path, manifest_path)
+            for change, names in manifest['changes'].items():
+                changes[change].extend(relative_directory + '/' + name for name in names)
+        return changes
+
+def find_changes(output_directory):
+    changes = {'added': [], 'changed': [], 'removed': []}
+    for manifest_path in sorted(Path(output_directory).rglob(MANIFEST_FILE_NAME)):
+        manifest = load_manifest(manifest_path.parent)
+        for change, names in manifest.get('changes', {}).items():
+            changes[change].extend(str(manifest_path.parent / name) for name in names)
+    return changes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List the outputs that changed in the last export, from the manifests under a directory.')
+    parser.add_argument('output_directory')
+    parser.add_argument('--include-removed', action='store_true', help='Also list files removed since the previous export.')
+    arguments = parser.parse_args()
+    changes = find_changes(arguments.output_directory)
+    for change in ['added', 'changed'] + (['removed'] if arguments.include_removed else []):
+        for path in changes[change]:
+            print(path)
@@ -0,0 +1,71 @@
+from threading import Condition, Event, Thread
+
+DEFAULT_RENDER_MEMORY = 256 * 1024 ** 2
+MEMORY_HEADROOM = 256 * 1024 ** 2
+
+
+def _read_proc_value(path, field):
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def get_available_memory():
+    return _read_proc_value('/proc/meminfo', 'MemAvailable')
+
+def get_peak_memory(pid):
+    return _read_proc_value('/proc/{}/status'.format(pid), 'VmHWM')
+
+class MemoryMonitor():
+    def __init__(self, process, poll_interval = 0.1):
+        self.process = process
+        self.poll_interval = poll_interval
+        self.peak_memory = None
+        self._done = Event()
+        self._thread = Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def _poll(self):
+        while True:
+            # VmHWM is the peak resident set size so far, so the last reading before exit wins.
+            peak_memory = get_peak_memory(self.process.pid)
+            if peak_memory:
+                self.peak_memory = max(self.peak_memory or 0, peak_memory)
+            if self._done.wait(self.poll_interval):
+                break
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        return self.peak_memory
+
+class MemoryLimiter():
+    def __init__(self, memory_budget, headroom = MEMORY_HEADROOM):
+        self.memory_budget = memory_budget
+        self.headroom = headroom
+        self._reserved = 0
+        self._condition = Condition()
+
+    def _has_room(self, estimate):
+        # A job is always admitted when nothing else is running, otherwise an oversized part would never start.
+        if self._reserved == 0:
+            return True
+        if self._reserved + estimate > self.memory_budget:
+            return False
+        available_memory = get_available_memory()
+        return available_memory is None or available_memory - estimate >= self.headroom
+
+    def acquire(self, estimate):
+        with self._condition:
+            while not self._has_room(estimate):
+                self._condition.wait(1)
+            self._reserved += estimate
+
+    def release(self, estimate):
+        with self._condition:
+            self._reserved -= estimate
+            self._condition.notify_all()
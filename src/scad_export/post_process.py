@@ -0,0 +1,118 @@
+import os
+import struct
+import zipfile
+from enum import StrEnum, auto
+from pathlib import Path
+
+from .duplication import get_temp_path
+
+_STL_HEADER = b'Binary STL written by scad_export'.ljust(80, b' ')
+
+
+class PostProcess(StrEnum):
+    BINARY_STL = auto()
+    REPACK_3MF = auto()
+
+def _is_ascii_stl(path):
+    with open(path, 'rb') as file:
+        start = file.read(512)
+    if not start.lstrip().startswith(b'solid'):
+        return False
+    # Binary STL headers may also start with "solid", so check the size matches the declared facet count.
+    if len(start) >= 84:
+        facet_count = struct.unpack('<I', start[80:84])[0]
+        if os.path.getsize(path) == 84 + facet_count * 50:
+            return False
+    return True
+
+def _read_ascii_facets(file):
+    normal = None
+    vertices = []
+    for line in file:
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == 'facet':
+            normal = [float(value) for value in parts[2:5]]
+            vertices = []
+        elif parts[0] == 'vertex':
+            vertices.extend(float(value) for value in parts[1:4])
+        elif parts[0] == 'endfacet':
+            yield normal + vertices
+
+def convert_stl_to_binary(path):
+    if not _is_ascii_stl(path):
+        return False
+    temp_path = get_temp_path(path)
+    facet = struct.Struct('<12fH')
+    try:
+        with open(path, 'r') as source, open(temp_path, 'wb') as destination:
+            destination.write(_STL_HEADER)
+            destination.write(struct.pack('<I', 0))
+            facet_count = 0
+            for values in _read_ascii_facets(source):
+                destination.write(facet.pack(*values, 0))
+                facet_count += 1
+            destination.seek(80)
+            destination.write(struct.pack('<I', facet_count))
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    return True
+
+def repack_zip(path, compression_level = 9):
+    temp_path = get_temp_path(path)
+    try:
+        with zipfile.ZipFile(path, 'r') as source, zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compression_level) as destination:
+            for item in source.infolist():
+                with source.open(item) as source_file, destination.open(_repacked_info(item), 'w') as destination_file:
+                    while chunk := source_file.read(1024 * 1024):
+                        destination_file.write(chunk)
+        if os.path.getsize(temp_path) >= os.path.getsize(path):
+            Path(temp_path).unlink()
+            return False
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    return True
+
+def _repacked_info(item: zipfile.ZipInfo):
+    info = zipfile.ZipInfo(item.filename, item.date_time)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = item.external_attr
+    return info
+
+def post_process_file(path, steps):
+    original_size = os.path.getsize(path)
+    suffix = Path(path).suffix.lower()
+    if PostProcess.BINARY_STL in steps and suffix == '.stl':
+        convert_stl_to_binary(path)
+    if PostProcess.REPACK_3MF in steps and suffix == '.3mf':
+        repack_zip(path)
+    return original_size, os.path.getsize(path)
+
+def archive_directory(directory, compression_level = 9, excluded_paths = ()):
+    directory = Path(directory)
+    excluded_paths = set(Path(excluded_path) for excluded_path in excluded_paths)
+    archive_path = directory.with_name(directory.name + '.zip')
+    temp_path = get_temp_path(archive_path)
+    original_size = 0
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compression_level) as archive:
+            for file_path in sorted(directory.rglob('*')):
+                if file_path.is_file() and not file_path.name.startswith('.') and file_path not in excluded_paths:
+                    original_size += file_path.stat().st_size
+                    archive.write(file_path, file_path.relative_to(directory))
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    return archive_path, original_size, os.path.getsize(archive_path)
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(size)
+        size /= 1024
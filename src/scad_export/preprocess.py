@@ -0,0 +1,70 @@
+import os
+import re
+from pathlib import Path
+
+from .dependencies import (_get_library_directories, _resolve_dependency,
+                           get_dependencies)
+from .duplication import get_temp_path
+from .render_cache import get_sources_hash
+
+# Comments and strings are matched first so statements inside them are left alone.
+_STATEMENT_PATTERN = re.compile(r'(//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\])*")|\b(include|use)\s*<([^>]+)>', re.DOTALL)
+_FILE_FUNCTION_PATTERN = re.compile(r'\b(import|surface|dxf_dim|dxf_cross)\s*\(')
+_KEPT_FILE_COUNT = 10
+
+
+class PreprocessError(Exception):
+    pass
+
+def _strip_comments_and_strings(source):
+    return _STATEMENT_PATTERN.sub(lambda match: '' if match.group(1) else match.group(0), source)
+
+def _flatten(file_path: Path, library_directories, flattened_directory: Path, including_files):
+    if file_path in including_files:
+        raise PreprocessError('{} includes itself'.format(file_path))
+    source = file_path.read_text(encoding='UTF-8')
+    # Files are read relative to the file doing the reading, which moves once its text is inlined.
+    if _FILE_FUNCTION_PATTERN.search(_strip_comments_and_strings(source)):
+        raise PreprocessError('{} reads files, which may use paths relative to it'.format(file_path))
+
+    def replace_statement(match):
+        if match.group(1):
+            return match.group(1)
+        statement, dependency_name = match.group(2), match.group(3).strip()
+        dependency = _resolve_dependency(dependency_name, file_path, library_directories)
+        if dependency is None:
+            # Left for OpenSCAD to find in its library directories, or fail to find, the same as it would from
+            # the original file. Unless it would now find a file next to the flattened one instead.
+            if (flattened_directory / dependency_name).exists():
+                raise PreprocessError('{} {}s {}, which would resolve differently from the preprocessed file'.format(file_path, statement, dependency_name))
+            return match.group(0)
+        if statement == 'use':
+            # Used files only contribute modules and functions, so they're loaded from where they are.
+            return 'use <{}>'.format(dependency.as_posix())
+        return '// include <{}>\n{}\n'.format(dependency_name, _flatten(dependency, library_directories, flattened_directory, including_files + [file_path]))
+
+    return _STATEMENT_PATTERN.sub(replace_statement, source)
+
+def _evict(directory: Path):
+    files = sorted((file for file in directory.glob('*.scad') if not file.name.startswith('.')), key=lambda file: file.stat().st_mtime, reverse=True)
+    for file in files[_KEPT_FILE_COUNT:]:
+        file.unlink(missing_ok=True)
+
+def get_flattened_export_file(export_file_path, openscad_location, directory, sources_hash = None):
+    # Inlines the export map's include tree into one file, keyed on the contents of everything it pulls in.
+    export_file_path = Path(export_file_path).resolve()
+    directory = Path(directory)
+    if not sources_hash:
+        sources_hash = get_sources_hash(get_dependencies(export_file_path, openscad_location))
+    flattened_path = directory / (sources_hash + '.scad')
+    if flattened_path.is_file():
+        os.utime(flattened_path)
+        return flattened_path
+    flattened_source = _flatten(export_file_path, _get_library_directories(openscad_location), directory, [])
+    directory.mkdir(parents=True, exist_ok=True)
+    temp_path = get_temp_path(flattened_path)
+    with open(temp_path, 'w', encoding='UTF-8') as file:
+        file.write(flattened_source)
+    os.replace(temp_path, flattened_path)
+    _evict(directory)
+    return flattened_path
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+from threading import Lock, get_ident
+
+from .duplication import DuplicationStrategy, duplicate
+
+
+def _hash_file(file_path, hasher):
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+
+def get_sources_hash(source_files):
+    hasher = hashlib.sha256()
+    for source_file in source_files:
+        hasher.update(str(source_file).encode('UTF-8'))
+        _hash_file(source_file, hasher)
+    return hasher.hexdigest()
+
+class RenderCache():
+    def __init__(self, directory, size_limit = 2 * 1024 ** 3, sources_hash = '', openscad_version = ''):
+        self.directory = Path(directory)
+        self.size_limit = size_limit
+        self.sources_hash = sources_hash
+        self.openscad_version = openscad_version
+        self._lock = Lock()
+        # Entry sizes and last-used times, so most puts don't need to list the directory.
+        self._entries = None
+        self._total_size = 0
+
+    def get_key(self, args, file_format):
+        hasher = hashlib.sha256()
+        for part in [self.sources_hash, self.openscad_version, file_format, *args]:
+            hasher.update(str(part).encode('UTF-8'))
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+
+    def _entry_path(self, key, file_format):
+        return self.directory / (key + file_format)
+
+    def get(self, key, file_format, output_path):
+        entry_path = self._entry_path(key, file_format)
+        with self._lock:
+            if not entry_path.is_file():
+                return False
+            # The modification time doubles as the last-used time for eviction.
+            os.utime(entry_path)
+            if self._entries is not None and entry_path in self._entries:
+                self._entries[entry_path] = (self._entries[entry_path][0], time.time())
+            # A reflink or copy rather than a hardlink, so editing the output in place can't change the cached file.
+            duplicate(entry_path, output_path, DuplicationStrategy.REFLINK)
+        return True
+
+    def put(self, key, file_format, rendered_path):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry_path = self._entry_path(key, file_format)
+        temp_path = entry_path.with_name(entry_path.name + '.tmp{}'.format(get_ident()))
+        shutil.copy(rendered_path, temp_path)
+        with self._lock:
+            os.replace(temp_path, entry_path)
+            if self._entries is None:
+                self._load_entries()
+            else:
+                self._total_size += os.path.getsize(entry_path) - self._entries.get(entry_path, (0, 0))[0]
+                self._entries[entry_path] = (os.path.getsize(entry_path), time.time())
+            if self._total_size > self.size_limit:
+                self._evict()
+
+    def _load_entries(self):
+        self._entries = {}
+        for entry in self.directory.iterdir():
+            if '.tmp' not in entry.name:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                self._entries[entry] = (stat.st_size, stat.st_mtime)
+        self._total_size = sum(size for size, _ in self._entries.values())
+
+    def _evict(self):
+        # Other exports may share the directory, so go by what's actually there before deleting anything.
+        self._load_entries()
+        for entry, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_size <= self.size_limit:
+                break
+            entry.unlink(missing_ok=True)
+            del self._entries[entry]
+            self._total_size -= size
+
+    def clear(self):
+        with self._lock:
+            if self.directory.is_dir():
+                shutil.rmtree(self.directory)
+            self._entries = None
+            self._total_size = 0
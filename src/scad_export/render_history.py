@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+from statistics import mean
+from threading import Lock
+
+
+class RenderHistory():
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except Exception:
+            return {}
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(temp_path, 'w') as file:
+                json.dump(self._entries, file, indent=2)
+            temp_path.replace(self.path)
+
+    def record(self, key, name, **metrics):
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            entry['name'] = name
+            entry.update(metrics)
+
+    def estimate(self, key, name, metric, default = 0):
+        with self._lock:
+            value = self._entries.get(key, {}).get(metric)
+            if value is not None:
+                return value
+            # Parts without history are estimated from other variants of the same module, then from every part.
+            same_name_values = [entry[metric] for entry in self._entries.values() if entry.get('name') == name and metric in entry]
+            if same_name_values:
+                return mean(same_name_values)
+            all_values = [entry[metric] for entry in self._entries.values() if metric in entry]
+            return mean(all_values) if all_values else default
@@ -0,0 +1,234 @@
+import os
+import pickle
+import platform
+import signal
+import socket
+import subprocess
+import time
+from multiprocessing.connection import Client
+from pathlib import Path
+from queue import Empty, Queue
+from subprocess import DEVNULL, Popen, TimeoutExpired
+from threading import Lock
+
+from .diagnostics import open_log, read_log
+from .memory_limiter import MemoryMonitor
+
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
+# Children get their own process group so cancelling can kill everything they started.
+if platform.system() == 'Windows':
+    _PROCESS_GROUP_OPTIONS = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    _PROCESS_GROUP_OPTIONS = {'start_new_session': True}
+
+
+def kill_process_tree(process):
+    # Takes a Popen or an asyncio process, which has no poll().
+    if isinstance(process, Popen):
+        process.poll()
+    if process.returncode is not None:
+        return
+    try:
+        if platform.system() == 'Windows':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=DEVNULL, stderr=DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        process.kill()
+
+class RenderResult():
+    def __init__(self, returncode, err = b'', peak_memory = None, timings = None, timed_out = False, diagnostics = None):
+        self.returncode = returncode
+        # Only the end of OpenSCAD's output is kept. The whole of it is in the log file.
+        self.err = err
+        self.peak_memory = peak_memory
+        self.timings = timings if timings else {}
+        self.timed_out = timed_out
+        self.diagnostics = diagnostics
+
+class Renderer():
+    def render(self, args, output_paths, config, monitor_memory = False, timeout = None, log_path = None) -> RenderResult:
+        pass
+
+    def cancel(self):
+        pass
+
+class LocalRenderer(Renderer):
+    def __init__(self):
+        self._processes = set()
+        self._lock = Lock()
+
+    def render(self, args, output_paths, config, monitor_memory = False, timeout = None, log_path = None):
+        start_time = time.perf_counter()
+        # OpenSCAD writes straight to the log, so a chatty render doesn't grow the export's memory.
+        with open_log(log_path) as log_file:
+            process = Popen(args + ['-o' + str(output_path) for output_path in output_paths], stdout=DEVNULL, stderr=log_file, **_PROCESS_GROUP_OPTIONS)
+            with self._lock:
+                self._processes.add(process)
+            spawned_time = time.perf_counter()
+            memory_monitor = MemoryMonitor(process) if monitor_memory else None
+            timed_out = False
+            try:
+                process.wait(timeout=timeout)
+            except TimeoutExpired:
+                kill_process_tree(process)
+                process.wait()
+                timed_out = True
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+            peak_memory = memory_monitor.stop() if memory_monitor else None
+            timings = {'spawn': spawned_time - start_time, 'openscad': time.perf_counter() - spawned_time}
+            err, diagnostics = read_log(log_file, 'Timed out after {} seconds'.format(timeout) if timed_out else None)
+        return RenderResult(process.returncode, err, peak_memory, timings, timed_out, diagnostics)
+
+    def cancel(self):
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_tree(process)
+
+def _parse_address(address):
+    if isinstance(address, str):
+        host, _, port = address.rpartition(':')
+        return (host, int(port))
+    return tuple(address)
+
+class _WorkerSlot():
+    def __init__(self, address, authkey):
+        self.address = _parse_address(address)
+        self.authkey = authkey
+        self.cancelled = False
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = Client(self.address, authkey=self.authkey)
+        return self._connection
+
+    def interrupt(self):
+        # Shutting the socket down wakes a recv blocked in another thread, which closing it wouldn't.
+        connection = self._connection
+        if connection is None:
+            return
+        try:
+            sock = socket.socket(fileno=connection.fileno())
+        except OSError:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        finally:
+            sock.detach()
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except OSError:
+                pass
+            self._connection = None
+
+class RemoteRenderer(Renderer):
+    # Each address is one render slot, so list a worker several times to run several jobs on it at once.
+    def __init__(self, addresses, authkey: bytes, retries = 2, retry_delay = 1):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._slots = Queue()
+        self._alive_count = len(addresses)
+        self._alive_lock = Lock()
+        self._busy_slots = set()
+        for address in addresses:
+            self._slots.put(_WorkerSlot(address, authkey))
+
+    def _acquire_slot(self):
+        while True:
+            with self._alive_lock:
+                if self._alive_count == 0:
+                    return None
+            try:
+                return self._slots.get(timeout=1)
+            except Empty:
+                pass
+
+    def _retire_slot(self, slot: _WorkerSlot):
+        slot.close()
+        with self._alive_lock:
+            self._alive_count -= 1
+
+    def _render_on_slot(self, slot: _WorkerSlot, job, output_paths):
+        connection = slot.connection
+        connection.send(job)
+        header = connection.recv()
+        transfer_start_time = time.perf_counter()
+        if header['returncode'] == 0:
+            for output_path in output_paths:
+                temp_path = Path(str(output_path) + '.part')
+                try:
+                    with open(temp_path, 'wb') as file:
+                        while chunk := connection.recv_bytes():
+                            file.write(chunk)
+                    os.replace(temp_path, output_path)
+                finally:
+                    temp_path.unlink(missing_ok=True)
+        timings = dict(header.get('timings', {}), transfer=time.perf_counter() - transfer_start_time)
+        return RenderResult(header['returncode'], header['err'], header.get('peak_memory'), timings, header.get('timed_out', False), header.get('diagnostics'))
+
+    def render(self, args, output_paths, config, monitor_memory = False, timeout = None, log_path = None):
+        job = {
+            'export_file': os.path.relpath(args[1], config.project_root),
+            'args': args[2:],
+            'file_formats': [Path(output_path).suffix for output_path in output_paths],
+            'timeout': timeout
+        }
+        error = 'No remote workers available'
+        for attempt in range(self.retries + 1):
+            slot = self._acquire_slot()
+            if slot is None:
+                break
+            with self._alive_lock:
+                self._busy_slots.add(slot)
+            # The slot always goes back to the queue or is retired, otherwise renders could wait forever for it.
+            slot_healthy = False
+            try:
+                result = self._render_on_slot(slot, job, output_paths)
+                slot_healthy = True
+            except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError) as e:
+                # The worker died or answered with something unreadable, so drop it and re-queue the job on another worker.
+                error = 'Worker {}:{} failed: {}'.format(*slot.address, e)
+                if config.debug and not slot.cancelled:
+                    print(error)
+            finally:
+                with self._alive_lock:
+                    self._busy_slots.discard(slot)
+                    cancelled, slot.cancelled = slot.cancelled, False
+                if cancelled:
+                    # The connection was cut to stop the render, which also stops it on the worker. The worker
+                    # itself is fine, so the slot reconnects on its next job.
+                    slot.close()
+                    self._slots.put(slot)
+                elif slot_healthy:
+                    self._slots.put(slot)
+                else:
+                    self._retire_slot(slot)
+            if slot_healthy:
+                if log_path:
+                    # Workers only send the end of the output back.
+                    with open_log(log_path) as log_file:
+                        log_file.write(result.err)
+                return result
+            if cancelled:
+                return RenderResult(-1, b'Cancelled')
+            time.sleep(self.retry_delay * attempt)
+        return RenderResult(-1, error.encode('UTF-8'))
+
+    def cancel(self):
+        with self._alive_lock:
+            busy_slots = list(self._busy_slots)
+            for slot in busy_slots:
+                slot.cancelled = True
+        for slot in busy_slots:
+            slot.interrupt()
@@ -1,7 +1,5 @@
-import ctypes
 import platform
 from functools import cached_property
-from tkinter import Tk, filedialog
 
 
 class Validation:
@@ -19,8 +17,12 @@ class Picker():
 
     @cached_property
     def _root_window(self):
+        # Imported here so headless runs never load Tk.
+        from tkinter import Tk
+
         # Prevents blurry picker window for Windows
         if platform.system() == 'Windows':
+            import ctypes
             ctypes.windll.user32.SetProcessDPIAware()
         root = Tk()
         root.wm_attributes('-alpha', 0)
@@ -35,6 +37,7 @@ class DirectoryPicker(Picker):
         super().__init__(initial_directory, window_title)
 
     def get_value(self):
+        from tkinter import filedialog
         root = super()._root_window
         root.update()
         value = filedialog.askdirectory(parent=root, title=self.window_title, initialdir=self.initial_directory)
@@ -46,6 +49,7 @@ class FilePicker(Picker):
         self.file_types = file_types
 
     def get_value(self):
+        from tkinter import filedialog
         root = super()._root_window
         root.update()
         if self.file_types:
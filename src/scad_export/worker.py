@@ -0,0 +1,102 @@
+import argparse
+import os
+import tempfile
+from multiprocessing.connection import Listener
+from pathlib import Path
+from threading import Event, Semaphore, Thread
+
+from .renderers import TRANSFER_CHUNK_SIZE, LocalRenderer
+
+
+class WorkerServer():
+    def __init__(self, address, authkey: bytes, openscad_location = 'openscad', project_root = '.', parallelism = os.cpu_count()):
+        self.openscad_location = openscad_location
+        self.project_root = Path(project_root).resolve()
+        self._listener = Listener(address, authkey=authkey)
+        self._render_slots = Semaphore(parallelism)
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def _watch_connection(self, connection, renderer: LocalRenderer, disconnected: Event, finished: Event):
+        # Clients send nothing while they wait for a render, so a readable connection means it was closed.
+        while not finished.is_set():
+            try:
+                readable = connection.poll(0.2)
+            except (EOFError, OSError):
+                readable = True
+            if readable and not finished.is_set():
+                disconnected.set()
+                renderer.cancel()
+                return
+
+    def _render(self, job, connection):
+        export_file = (self.project_root / job['export_file']).resolve()
+        if not export_file.is_relative_to(self.project_root):
+            connection.send({'returncode': -1, 'err': b'Export file outside of project root'})
+            return
+        # Each job gets its own renderer, so a client that goes away only kills its own render.
+        renderer = LocalRenderer()
+        disconnected = Event()
+        finished = Event()
+        Thread(target=self._watch_connection, args=(connection, renderer, disconnected, finished), daemon=True).start()
+        try:
+            with self._render_slots, tempfile.TemporaryDirectory() as temp_directory:
+                if disconnected.is_set():
+                    return
+                output_paths = [Path(temp_directory) / ('output{}{}'.format(index, file_format)) for index, file_format in enumerate(job['file_formats'])]
+                args = [self.openscad_location, str(export_file)] + job['args']
+                result = renderer.render(args, output_paths, None, monitor_memory=True, timeout=job.get('timeout'))
+                finished.set()
+                if disconnected.is_set():
+                    return
+                connection.send({'returncode': result.returncode, 'err': result.err, 'peak_memory': result.peak_memory, 'timings': result.timings, 'timed_out': result.timed_out, 'diagnostics': result.diagnostics})
+                if result.returncode == 0:
+                    for output_path in output_paths:
+                        with open(output_path, 'rb') as file:
+                            while chunk := file.read(TRANSFER_CHUNK_SIZE):
+                                connection.send_bytes(chunk)
+                        connection.send_bytes(b'')
+        finally:
+            finished.set()
+
+    def _handle_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    job = connection.recv()
+                    self._render(job, connection)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return
+            Thread(target=self._handle_connection, args=(connection,), daemon=True).start()
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self._listener.close()
+
+def start_local_worker(authkey: bytes, openscad_location = 'openscad', project_root = '.', parallelism = os.cpu_count()):
+    return WorkerServer(('localhost', 0), authkey, openscad_location, project_root, parallelism).start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render SCAD Export jobs sent by remote exports.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8750)
+    parser.add_argument('--authkey', required=True)
+    parser.add_argument('--openscad', default='openscad')
+    parser.add_argument('--project-root', default='.')
+    parser.add_argument('--parallelism', type=int, default=os.cpu_count())
+    arguments = parser.parse_args()
+    server = WorkerServer((arguments.host, arguments.port), arguments.authkey.encode('UTF-8'), arguments.openscad, arguments.project_root, arguments.parallelism)
+    print('Listening on {}:{}'.format(*server.address))
+    server.serve_forever()
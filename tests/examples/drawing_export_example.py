@@ -9,4 +9,5 @@ exportables=Folder(
     )
 )
 
-export(exportables)
+if __name__ == '__main__':
+    export(exportables)
@@ -34,5 +34,6 @@ exportables=Folder(
     ]
 )
 
-# Invoke the logic to export the exportables to files and folders.
-export(exportables)
+if __name__ == '__main__':
+    # Invoke the logic to export the exportables to files and folders.
+    export(exportables)
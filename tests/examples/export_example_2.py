@@ -18,4 +18,5 @@ exportables=Folder(
     ]
 )
 
-export(exportables)
+if __name__ == '__main__':
+    export(exportables)
@@ -20,4 +20,5 @@ config = ExportConfig(
     default_image_size=ImageSize(width=500, height=500)
 )
 
-export(exportables, config)
+if __name__ == '__main__':
+    export(exportables, config)
@@ -8,4 +8,5 @@ exportables=Folder(
     ]
 )
 
-export(exportables)
+if __name__ == '__main__':
+    export(exportables)